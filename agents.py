@@ -1,7 +1,17 @@
 import sys
 from util import *
+from gameState import GameState
+from transposition import TranspositionTable, SharedTranspositionTable
 import random
-import pickle
+from weightStore import loadWeights
+from evaluation import LinearEvaluator
+from openingBook import loadBook
+from symmetry import transformMove, inverseTransformMove
+from threats import findForcedWin
+from solver import ProofNumberSolver, WIN, DRAW, LOSS
+from searchStats import SearchStats
+import time
+import multiprocessing
 
 #Class agent is lifted directly from the pacman code
 class Agent:
@@ -21,57 +31,227 @@ class Agent:
     """
     raiseNotDefined()
 
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the time budget for the move has run out.
+    """
+    pass
+
 class MinimaxAgent(Agent):
     """
       Your minimax agent with alpha-beta pruning 
+
+      Search results are kept in a transposition table that lives for the
+      whole game. ttMemoryMB caps its size; None turns it off.
+
+      If timeLimit (seconds) is given, depth is ignored and the agent deepens
+      1, 2, 3, ... until the time is up, returning the best move of the
+      last search that finished. The time limit counts from the start of
+      getAction and also bounds the solver and the threat-space searches;
+      if even depth 1 does not finish, the best root move scored so far is
+      returned.
+
+      Children are searched in stages: the transposition table move, then
+      the killer moves of the ply that selectActions picked, and then the
+      rest of its picks, whose ties are broken by the history table. A
+      cutoff by the table move saves the static evaluation of every child.
+      At most branchingFactor distinct moves are searched per node.
+
+      With numWorkers > 1 the search is Lazy SMP: numWorkers - 1 helper
+      processes are forked for every move and search the same root, each with
+      its own move order tie-breaks, every other helper one ply deeper. They
+      share results only through a transposition table in shared memory.
+      The move of the deepest search that finished is returned.
+
+      With an openingBook (see openingBook.py), positions in the book are
+      answered with the best book move played at least bookMinSamples times,
+      without any search.
+
+      With threatSearch (two players), a threat-space search (see threats.py)
+      looks for a forced win of fours (VCF) or fours and threes (VCT) at the
+      root before searching, and every reply to a root move is scored as lost
+      if the opponent then has a VCF.
+
+      With a solver cache file (two players, see solver.py), the proof-number
+      solver tries to solve the root within solverMaxNodes expansions, and a
+      solved root that is not lost is played from the proof. Positions the
+      solver has proved are scored exactly everywhere in the search.
+
+      With collectStats, every move's SearchStats (see searchStats.py) is kept
+      in lastSearchStats. Helper processes of Lazy SMP are not counted.
     """
 
     WINNING_SCORE = 100000 # a very big number
 
-    def __init__(self, index, verbose, depth = 2, branchingFactor = 5, hardCodedWeights = False):
+    # Killer moves remembered per ply
+    NUM_KILLERS = 2
+
+    # Threat-space search limits (see threats.py)
+    THREAT_PLIES = 1 # plies below the root where a VCF of the player to move is looked for
+    VCF_MAX_NODES = 200
+    VCT_MAX_NODES = 300
+
+    def __init__(self, index, verbose, depth = 2, branchingFactor = 5, hardCodedWeights = False, ttMemoryMB = 16,
+                 timeLimit = None, weightsFile = 'weightVector4.p', numWorkers = 1, openingBook = None, bookMinSamples = 3,
+                 threatSearch = True, solver = None, solverMaxNodes = 2000, collectStats = False):
         self.index = index
         self.depth = depth
+        self.timeLimit = timeLimit
         self.branchingFactor = branchingFactor
         self.hardCodedWeights = hardCodedWeights
-
+        self.numWorkers = numWorkers
+        self.transpositionTable = None
+        if numWorkers > 1:
+            # Helper processes need a table, shared with this process
+            self.transpositionTable = SharedTranspositionTable(ttMemoryMB if ttMemoryMB != None else 16)
+        elif ttMemoryMB != None:
+            self.transpositionTable = TranspositionTable(ttMemoryMB)
+        self.stopSearch = None # set in helper processes, see startHelpers
+        self.deadline = None # time.time() the running search has to stop at, if any
+        self.rootScores = {} # root move => score, of the running iteration
+        self.previousRootScores = {} # the same, of the last iteration that finished
+        self.openingBook = loadBook(openingBook) if openingBook != None else None
+        self.bookMinSamples = bookMinSamples
+        self.threatSearch = threatSearch
+        self.solverPath = solver
+        self.solverMaxNodes = solverMaxNodes
+        self.solver = None # ProofNumberSolver of the board, made by getSolver
+        self.collectStats = collectStats
+        self.searchStats = None # SearchStats of the move being searched, if collectStats
+        self.lastSearchStats = None
+        self.numPiecesSeen = 0
+        self.killers = {} # ply => list of moves that caused a cutoff
+        self.history = {} # position => how often and how deep it caused a cutoff
+
+        # Loaded once per process and shared by every agent (see weightStore.py)
         try:
-            with open('weightVector4.p', 'rb') as f:
-                self.weights = pickle.load(f)
-                f.close()
+            self.weights = loadWeights(weightsFile)
         except IOError:
             self.weights = {}
+        self.evaluator = None # LinearEvaluator of self.weights, compiled by getEvaluator
         self.discount = 1
         self.verbose = verbose
 
     def getAction(self, gameState):
         """
           Returns the minimax action using self.depth and self.evaluationFunction
+          The search makes and undoes moves on a single copy of gameState.
         """
+        table = self.transpositionTable
+        startTime = time.time()
+        deadline = startTime + self.timeLimit if self.timeLimit != None else None
+        stats = SearchStats() if self.collectStats else None
+        self.searchStats = stats
+
         # a <= score <= b
         def recurseWithAlphaBeta(state, d, agentIndex, a, b):
+            if stats != None:
+                stats.nodes += 1
+            # A look at the clock is cheap next to ordering the moves of a node
+            if self.deadline != None and (time.time() > self.deadline or
+                                          (self.stopSearch != None and self.stopSearch.value)):
+                raise SearchTimeout()
+
             if state.gameEnded():
                 if state.getWinner() == self.index:
                     return (self.WINNING_SCORE, None)
                 else:
                     return (- self.WINNING_SCORE, None)
             if d == 0 and agentIndex == self.index:
+                if stats != None:
+                    stats.leaves += 1
                 return (self.evaluationFunction(state), None)
 
+            if solver != None and len(state.undoStack) > 0:
+                result = solver.lookup(state)
+                if result == DRAW:
+                    return (0, None)
+                if result != None:
+                    won = (result == WIN) == (agentIndex == self.index)
+                    return (self.WINNING_SCORE if won else - self.WINNING_SCORE, None)
+
+            if self.threatSearch and 0 < len(state.undoStack) <= self.THREAT_PLIES and state.numPlayers == 2:
+                if findForcedWin(state, agentIndex, maxNodes = self.VCF_MAX_NODES, deadline = self.deadline) != None:
+                    return (self.WINNING_SCORE if agentIndex == self.index else - self.WINNING_SCORE, None)
+
+            ttMove = None
+            if table != None:
+                # Symmetric positions share one entry, stored in the canonical frame
+                key, transform = state.getCanonicalHash()
+                entry = table.probe(key)
+                if entry != None and entry[3] != None:
+                    entry = entry[:3] + (inverseTransformMove(transform, entry[3], state.boardSize),)
+                # The root (nothing made on the search copy yet) always needs a full search
+                if entry != None and len(state.undoStack) > 0:
+                    entryDepth, flag, entryScore, ttMove = entry
+                    if entryDepth >= d and (flag == TranspositionTable.EXACT or
+                                            (flag == TranspositionTable.LOWER and entryScore > b) or
+                                            (flag == TranspositionTable.UPPER and entryScore < a)):
+                        if stats != None:
+                            stats.ttCutoffs += 1
+                        return (entryScore, ttMove)
+                elif entry != None:
+                    ttMove = entry[3]
+
             nextAgentIndex = (agentIndex + 1) % state.numPlayers
             legalMoves = state.getLegalActions()
             if len(legalMoves) == 0:
                 # This happens when there's a tie
                 return (0, None)
 
-            # evaluate and sort legal actions
-            prunedLegalMoves = self.selectActions(state, legalMoves, agentIndex)
-
+            ply = len(state.undoStack)
+            isRoot = ply == 0 # nothing has been made on the search copy yet
+
+            def orderedActions():
+                # The table move first, without any static evaluation
+                searched = set()
+                if ttMove != None and ttMove in state.legalActions:
+                    searched.add(ttMove)
+                    yield ttMove
+
+                # evaluate and sort legal actions
+                prunedLegalMoves = self.selectActions(state, legalMoves, agentIndex)
+                # The root is ordered by the previous iteration
+                if isRoot and self.previousRootScores:
+                    prunedLegalMoves.sort(key = lambda x: -self.previousRootScores.get(x[1], float('-inf')))
+                prunedActions = set(action for _, action in prunedLegalMoves)
+                # Killers only jump the queue among the selected moves
+                for action in self.killers.get(ply, []):
+                    if action in prunedActions and action not in searched:
+                        searched.add(action)
+                        yield action
+                # Up to branchingFactor moves in all, at least one of them selected
+                for _, action in prunedLegalMoves:
+                    if len(searched) >= self.branchingFactor and searched & prunedActions:
+                        break
+                    if action not in searched:
+                        searched.add(action)
+                        yield action
+
+            def recordCutoff(action):
+                killers = self.killers.setdefault(ply, [])
+                if action in killers:
+                    killers.remove(action)
+                killers.insert(0, action)
+                del killers[self.NUM_KILLERS:]
+                self.history[action] = self.history.get(action, 0) + d * d + 1
+
+            originalA = a
+            originalB = b
+            cutoff = False
             if agentIndex == self.index: # this agent
                 bestScore = float('-inf')
                 bestActions = []
-                for _, action, nextState  in prunedLegalMoves:
-                    score, _ = recurseWithAlphaBeta(nextState, d - 1, nextAgentIndex, a, b)
+                for moveIndex, action in enumerate(orderedActions()):
+                    state.makeMove(agentIndex, action)
+                    try:
+                        score, _ = recurseWithAlphaBeta(state, d - 1, nextAgentIndex, a, b)
+                    finally:
+                        # A timeout unwinds through here: leave the search copy as it was
+                        state.undoMove()
                     score *= self.discount # Add discount
+                    if isRoot:
+                        self.rootScores[action] = score
                     if score > bestScore:
                         bestScore = score
                         bestActions = [action]
@@ -79,50 +259,265 @@ class MinimaxAgent(Agent):
                         bestActions.append(action)
                     a = max(a, bestScore)
                     if a > b:
+                        cutoff = True
+                        recordCutoff(action)
+                        if stats != None:
+                            stats.addCutoff(moveIndex)
                         break
                     ### For debug purposes
                     #if self.verbose and d == self.depth:
                     #    print 'Action: ', action
                     #    print 'Score: ', score
                     #    print '----------------------------'
-                return (bestScore, random.choice(bestActions))
+                bestAction = random.choice(bestActions)
+                if table != None:
+                    if cutoff:
+                        flag = TranspositionTable.LOWER
+                    elif bestScore <= originalA:
+                        flag = TranspositionTable.UPPER
+                    else:
+                        flag = TranspositionTable.EXACT
+                    table.store(key, d, flag, bestScore, transformMove(transform, bestAction, state.boardSize))
+                return (bestScore, bestAction)
 
             else: # all other agents
                 worstScore = float('inf')
-                for _, action, nextState  in prunedLegalMoves:
-                    score, _ = recurseWithAlphaBeta(nextState, d, nextAgentIndex, a, b)
+                worstAction = None
+                for moveIndex, action in enumerate(orderedActions()):
+                    state.makeMove(agentIndex, action)
+                    try:
+                        score, _ = recurseWithAlphaBeta(state, d, nextAgentIndex, a, b)
+                    finally:
+                        # A timeout unwinds through here: leave the search copy as it was
+                        state.undoMove()
                     score *= self.discount
                     if score < worstScore:
                         worstScore = score
+                        worstAction = action
                     b = min(b, worstScore)
                     if b < a:
+                        cutoff = True
+                        recordCutoff(action)
+                        if stats != None:
+                            stats.addCutoff(moveIndex)
                         break
+                if table != None:
+                    if cutoff:
+                        flag = TranspositionTable.UPPER
+                    elif worstScore >= originalB:
+                        flag = TranspositionTable.LOWER
+                    else:
+                        flag = TranspositionTable.EXACT
+                    table.store(key, d, flag, worstScore,
+                                transformMove(transform, worstAction, state.boardSize) if worstAction != None else None)
                 return (worstScore, None)
-            
-        score, action = recurseWithAlphaBeta(gameState, self.depth, self.index, float('-inf'), float('inf'))
+
+        # Fewer pieces than last time means a new game has started
+        if len(gameState.board) < self.numPiecesSeen:
+            self.history = {}
+            if table != None:
+                table.clear()
+        self.numPiecesSeen = len(gameState.board)
+
+        if self.openingBook != None:
+            bookMove = self.openingBook.bestMove(gameState, self.bookMinSamples)
+            if bookMove != None:
+                if self.verbose:
+                    print 'Book move: ', bookMove
+                return self.finishSearch(bookMove, 'book', startTime)
+        if table != None:
+            table.newSearch()
+        # Plies are counted from the root, so killers of the last move do not apply
+        self.killers = {}
+        # Older cutoffs count less
+        for action in self.history.keys():
+            self.history[action] /= 2
+            if self.history[action] == 0:
+                del self.history[action]
+
+        state = GameState(gameState.N, gameState.boardSize, gameState.numPlayers, prevState = gameState)
+
+        solver = self.getSolver(state)
+        if solver != None:
+            solved = solver.bestMove(state, self.solverMaxNodes, deadline)
+            if solved != None and solved[1] != LOSS:
+                if self.verbose:
+                    print 'Solved move: ', solved
+                return self.finishSearch(solved[0], 'solver', startTime)
+        if self.threatSearch and state.numPlayers == 2 and len(state.board) > 0:
+            win = findForcedWin(state, self.index, maxNodes = self.VCF_MAX_NODES, deadline = deadline)
+            if win == None:
+                win = findForcedWin(state, self.index, useThrees = True, maxNodes = self.VCT_MAX_NODES,
+                                    deadline = deadline)
+            if win != None:
+                if self.verbose:
+                    print 'Forced win: ', win
+                return self.finishSearch(win[0], 'threat', startTime)
+        self.deadline = None
+        self.rootScores = {}
+        self.previousRootScores = {}
+        helpers = None
+        if self.numWorkers > 1:
+            helpers = self.startHelpers(state, recurseWithAlphaBeta, deadline)
+
+        if self.timeLimit == None:
+            iterationStart = time.time()
+            score, action = recurseWithAlphaBeta(state, self.depth, self.index, float('-inf'), float('inf'))
+            if stats != None:
+                stats.addDepth(self.depth, time.time() - iterationStart, stats.nodes)
+            if helpers != None:
+                depth, score, action = self.stopHelpers(helpers, (self.depth, score, action))
+            if self.verbose:
+                print 'Score: ', score
+            return self.finishSearch(action, 'search', startTime)
+
+        # Iterative deepening
+        self.deadline = deadline
+        iterationStart = time.time()
+        try:
+            score, action = recurseWithAlphaBeta(state, 1, self.index, float('-inf'), float('inf'))
+            depth = 1
+            if stats != None:
+                stats.addDepth(1, time.time() - iterationStart, stats.nodes)
+        except SearchTimeout:
+            # Not even depth 1 finished: the best root move scored so far, else the first one selected
+            depth = 0
+            if self.rootScores:
+                action = max(self.rootScores, key = lambda move: self.rootScores[move])
+                score = self.rootScores[action]
+            else:
+                score, action = self.selectActions(state, state.getLegalActions(), self.index)[0]
+        maxDepth = gameState.boardSize ** 2 - len(gameState.board)
+        while depth < maxDepth and abs(score) < self.WINNING_SCORE and time.time() < deadline:
+            self.previousRootScores = self.rootScores
+            self.rootScores = {}
+            iterationStart = time.time()
+            nodesBefore = stats.nodes if stats != None else 0
+            try:
+                score, action = recurseWithAlphaBeta(state, depth + 1, self.index, float('-inf'), float('inf'))
+            except SearchTimeout:
+                break
+            depth += 1
+            if stats != None:
+                stats.addDepth(depth, time.time() - iterationStart, stats.nodes - nodesBefore)
+        self.deadline = None
+        if helpers != None:
+            depth, score, action = self.stopHelpers(helpers, (depth, score, action))
         if self.verbose:
-            print 'Score: ', score
+            print 'Score: ', score, '(depth ' + str(depth) + ')'
+        return self.finishSearch(action, 'search', startTime)
+
+    def finishSearch(self, action, source, startTime):
+        """
+        Returns action, after completing the statistics of the search that chose it
+        (source is how it was chosen) if they are collected.
+        """
+        stats = self.searchStats
+        if stats != None:
+            stats.time = time.time() - startTime
+            stats.sources[source] = 1
+            self.lastSearchStats = stats
+            self.searchStats = None
         return action
 
+    def startHelpers(self, state, search, deadline):
+        """
+        Forks numWorkers - 1 processes searching state with search (recurseWithAlphaBeta).
+        Helper i iterates depths from 1 + i % 2 until it is stopped, or up to
+        self.depth + i % 2 without a time limit, and reports every depth it
+        finishes as (depth, score, action).
+        Returns (processes, results queue, stop flag) for stopHelpers.
+        """
+        results = multiprocessing.Queue()
+        stop = multiprocessing.RawValue('b', 0)
+
+        def helperSearch(helperIndex):
+            random.seed((helperIndex, state.hash))
+            self.stopSearch = stop
+            self.deadline = deadline if deadline != None else float('inf')
+            # Different tie-breaks send the helpers down different parts of the tree
+            for action in state.legalActions:
+                self.history[action] = self.history.get(action, 0) + random.random()
+
+            depth = 1 + helperIndex % 2
+            if self.timeLimit == None:
+                maxDepth = self.depth + helperIndex % 2
+            else:
+                maxDepth = state.boardSize ** 2 - len(state.board)
+            while depth <= maxDepth:
+                self.previousRootScores = self.rootScores
+                self.rootScores = {}
+                try:
+                    score, action = search(state, depth, self.index, float('-inf'), float('inf'))
+                except SearchTimeout:
+                    break
+                results.put((depth, score, action))
+                if abs(score) >= self.WINNING_SCORE:
+                    break
+                depth += 1
+
+        processes = []
+        for helperIndex in range(1, self.numWorkers):
+            process = multiprocessing.Process(target = helperSearch, args = (helperIndex,))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        return (processes, results, stop)
+
+    def stopHelpers(self, helpers, result):
+        """
+        Stops the helpers of startHelpers. result is the (depth, score, action) of
+        this process' search. Returns the deepest result of any process, this
+        process' own on equal depth.
+        """
+        processes, results, stop = helpers
+        stop.value = 1
+        best = result
+        finished = 0
+        while finished < len(processes):
+            # Drain the queue while waiting, so no helper blocks on a full pipe
+            while not results.empty():
+                helperResult = results.get()
+                if helperResult[0] > best[0]:
+                    best = helperResult
+            finished = 0
+            for process in processes:
+                process.join(0.001)
+                if not process.is_alive():
+                    finished += 1
+        while not results.empty():
+            helperResult = results.get()
+            if helperResult[0] > best[0]:
+                best = helperResult
+        return best
+
     def selectActions(self, state, legalMoves, agentIndex):
+        """
+        Returns a list of (estimate, action) for the most promising actions,
+        best first for agentIndex. state is left unchanged.
+        """
         estimates = [] # estimates of the next state
-        for action in legalMoves:
-            nextState = state.generateSuccessor(agentIndex, action)
-            if nextState.gameEnded():
-                if nextState.getWinner() == agentIndex:
+        results = self.evaluateActions(state, legalMoves, agentIndex)
+        if self.searchStats != None:
+            self.searchStats.orderings += len(results)
+        for score, action, winner in results:
+            if score == None:
+                if winner == agentIndex:
                     # if it's a game winning move
-                    return [(self.WINNING_SCORE, action, nextState)]
+                    return [(self.WINNING_SCORE, action)]
                 else:
-                    estimates.append((- self.WINNING_SCORE, action, nextState))
+                    estimates.append((- self.WINNING_SCORE, action))
             else:
-                estimates.append((self.evaluationFunction(nextState), action, nextState))
+                estimates.append((score, action))
 
+        # Ties are broken by the history table
+        history = self.history
         if agentIndex == self.index:
             # Max agent
-            estimates.sort(key = lambda x: -x[0])
+            estimates.sort(key = lambda x: (-x[0], -history.get(x[1], 0)))
         else:
             # Min agent
-            estimates.sort(key = lambda x: x[0])
+            estimates.sort(key = lambda x: (x[0], -history.get(x[1], 0)))
         
         movesToWin = state.N
         blockedPreLose = 'blocked ' + str(movesToWin - 1)
@@ -198,19 +593,100 @@ class MinimaxAgent(Agent):
                 piecesToBlockFrozenSet = next(iter(featuresForAction))
                 move = getActionToBlockOpenPrelose(state, piecesToBlockFrozenSet)
 
-                nextState = state.generateSuccessor(agentIndex, action)
-                return [(self.evaluationFunction(nextState), action, nextState)]
+                state.makeMove(agentIndex, action)
+                score = self.evaluationFunction(state)
+                state.undoMove()
+                return [(score, action)]
 
+        # The branch above tests the (player, move) tuple as a position, so it is never taken.
+        # The positions it was meant for are only counted, without changing the moves searched.
+        if self.searchStats != None and state.previousAction != None and \
+                state.previousAction[1] in state.positionToFeatures:
+            featuresForAction = state.positionToFeatures[state.previousAction[1]]
+            previousPlayer = state.previousAction[0]
+            if (previousPlayer, blockedPreLose) in featuresForAction or (previousPlayer, openPreLose) in featuresForAction:
+                self.searchStats.forcedBlocks += 1
 
         return estimates[:self.branchingFactor]
 
 
+    def evaluateActions(self, state, legalMoves, agentIndex):
+        """
+        Scores the state after agentIndex plays each of legalMoves, all in one call.
+        Returns a list of (score, action, winner), where score is None if the move ends the game.
+        The list stops at the first move that wins the game for agentIndex.
+        state is left unchanged.
+
+        With learned weights (and two players) the children are not made or
+        evaluated one by one: the parent's features are scored once with the
+        children's turn, and each child only adds the weight changes of the
+        few features its move would change (GameState.getFeatureChanges).
+        """
+        results = []
+        if self.hardCodedWeights or state.numPlayers != 2:
+            for action in legalMoves:
+                state.makeMove(agentIndex, action)
+                if state.gameEnded():
+                    results.append((None, action, state.getWinner()))
+                else:
+                    results.append((self.evaluationFunction(state), action, -1))
+                state.undoMove()
+                if results[-1][2] == agentIndex:
+                    break
+            return results
+
+        evaluator = self.getEvaluator(state)
+        isTurn = (state.currentPlayer + 1) % state.numPlayers == self.index
+        base = evaluator.evaluate(state, isTurn)
+        weight = evaluator.weight
+        slots = state.featureSlots
+        counts = state.featureCounts
+
+        boardFull = len(state.board) + 1 == state.boardSize ** 2
+        for action in legalMoves:
+            changes, wins = state.getFeatureChanges(agentIndex, action)
+            if wins:
+                results.append((None, action, agentIndex))
+                break
+            if boardFull:
+                results.append((None, action, -1))
+                continue
+            score = base
+            for feature, change in changes.items():
+                if change != 0:
+                    slot = slots[feature]
+                    num = counts[slot]
+                    score += weight(isTurn, slot, num + change) - weight(isTurn, slot, num)
+            results.append((score, action, -1))
+        return results
+
+    def getEvaluator(self, state):
+        """
+        Returns self.weights compiled for state's board, compiling them again
+        only when the weights or the board change.
+        """
+        evaluator = self.evaluator
+        if evaluator == None or not evaluator.matches(self.weights, self.index, state.boardSize, state.numPlayers):
+            evaluator = LinearEvaluator(self.weights, self.index, state.boardSize, state.numPlayers)
+            self.evaluator = evaluator
+        return evaluator
+
+    def getSolver(self, state):
+        """
+        Returns the ProofNumberSolver of state's board, or None without a solver cache file.
+        """
+        if self.solverPath == None or state.numPlayers != 2:
+            return None
+        solver = self.solver
+        if solver == None or solver.boardSize != state.boardSize or solver.N != state.N:
+            solver = ProofNumberSolver(state.boardSize, state.N, cachePath = self.solverPath)
+            self.solver = solver
+        return solver
+
     def evaluationFunction(self, state):
         if not self.hardCodedWeights:
-            score = 0
-            features = state.getFeatures(self.index)
-            featureVector = {key:1 for key in features}
-            return dotProduct(featureVector, self.weights)
+            # Same as the dot product of state.getFeatures(self.index) with self.weights
+            return self.getEvaluator(state).evaluate(state)
         else:
             # original implementation
             weights = {'blocked 2': 10, 'open 2': 100, 'blocked 3': 100, 'open 3': 1000, 'blocked 4': 1000, 'open 4': 10000, 'blocked 5': 10000}
@@ -249,6 +725,10 @@ class MinimaxAgent(Agent):
 
     def updateWeights(self, weights):
         self.weights = dict(weights)
+        self.evaluator = None
+        # Stored scores were computed with the old weights
+        if self.transpositionTable != None:
+            self.transpositionTable.clear()
 
 
 class RandomAgent(Agent):
@@ -0,0 +1,82 @@
+"""
+Vectorized feature extraction for many boards at once.
+
+A stack of boards is an (n, boardSize, boardSize) int8 array where
+boards[i, x, y] is the index of the player with a stone at (x, y) on board i,
+or EMPTY. The features are the same (player, 'open k') / (player, 'blocked k')
+counts that GameState keeps incrementally in GameState.features, so the two
+can be checked against each other.
+"""
+
+import numpy as np
+from bitboard import BitBoard
+
+EMPTY = -1
+
+def statesToBoards(states):
+    """
+    Returns the boards of a list of GameStates as an (n, boardSize, boardSize) int8 array.
+    """
+    boardSize = states[0].boardSize
+    boards = np.full((len(states), boardSize, boardSize), EMPTY, dtype = np.int8)
+    for i, state in enumerate(states):
+        for (x, y), player in state.board.items():
+            boards[i, x, y] = player
+    return boards
+
+def shift(a, dx, dy, fill):
+    """
+    Returns b with b[:, x, y] = a[:, x + dx, y + dy], and fill where that is off the board.
+    """
+    size = a.shape[1]
+    b = np.full(a.shape, fill, dtype = a.dtype)
+    xs, xd = (slice(dx, size), slice(0, size - dx)) if dx >= 0 else (slice(0, size + dx), slice(-dx, size))
+    ys, yd = (slice(dy, size), slice(0, size - dy)) if dy >= 0 else (slice(0, size + dy), slice(-dy, size))
+    b[:, xd, yd] = a[:, xs, ys]
+    return b
+
+def featureCounts(boards, numPlayers = 2):
+    """
+    Returns an (n, numPlayers, 2, boardSize + 1) int32 array of feature counts.
+    counts[i, player, 0, k] is the number of open k (runs of k with both ends empty),
+    counts[i, player, 1, k] the number of blocked k (exactly one end empty) on board i.
+    Runs are maximal, so a 4 is not also counted as a 3. Only k >= 2 is filled in.
+    """
+    n, boardSize, _ = boards.shape
+    counts = np.zeros((n, numPlayers, 2, boardSize + 1), dtype = np.int32)
+    for player in range(numPlayers):
+        own = boards == player
+        # Stones of other players block a run, and so does the edge (the fill below)
+        blocked = (boards != EMPTY) & ~own
+        for dx, dy in BitBoard.DIRECTIONS:
+            blockedBefore = shift(blocked, -dx, -dy, True)
+            starts = own & ~shift(own, -dx, -dy, False)
+            # runK[c]: the k cells from c on are all own; blockedAfterK[c]: the cell k steps after c blocks
+            runK = own
+            blockedAfterK = shift(blocked, dx, dy, True)
+            for k in range(1, boardSize + 1):
+                runNext = own & shift(runK, dx, dy, False)
+                exact = starts & runK & ~runNext
+                if k >= 2:
+                    counts[:, player, 0, k] += (exact & ~blockedBefore & ~blockedAfterK).sum(axis = (1, 2))
+                    counts[:, player, 1, k] += (exact & (blockedBefore ^ blockedAfterK)).sum(axis = (1, 2))
+                if not runNext.any():
+                    break
+                runK = runNext
+                blockedAfterK = shift(blockedAfterK, dx, dy, True)
+    return counts
+
+def extractFeatures(boards, numPlayers = 2):
+    """
+    Returns a list with, for each board, a dictionary of ((player, description) => number)
+    in the form of GameState.features.
+    """
+    counts = featureCounts(boards, numPlayers)
+    result = []
+    for i in range(counts.shape[0]):
+        features = {}
+        for player, blockedIndex, k in zip(*np.nonzero(counts[i])):
+            description = ('open ' if blockedIndex == 0 else 'blocked ') + str(k)
+            features[(int(player), description)] = int(counts[i, player, blockedIndex, k])
+        result.append(features)
+    return result
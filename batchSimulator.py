@@ -0,0 +1,179 @@
+"""
+Random games played in lockstep, many at a time, with NumPy.
+
+K games are kept as one (K, boardSize, boardSize) int8 array, in the layout of
+batchFeatures.py (boards[i, x, y] is the player with a stone at (x, y) or EMPTY).
+Every step makes one move in every unfinished game: a random empty cell next
+to a stone, as RandomAgent plays (the middle of the board on an empty board).
+Only the lines through the new stones are checked for N in a row. A finished
+game is handed out as (winner, moves), and its slot starts a new game while
+games are left to play.
+
+The moves are lists of (x, y) in the order they were played, so a game can be
+appended to a record with GameRecordWriter.write, and turned into the TD
+transitions the trainers take with learning.transitionsFromGame.
+
+    python batchSimulator.py boardSize N numGames [--batch=K] [--record=file] [--seed=S]
+"""
+
+import sys
+import time
+import numpy as np
+from bitboard import BitBoard
+from batchFeatures import EMPTY
+from gameRecord import GameRecordWriter
+from util import parseOptions
+
+class BatchSimulator():
+    """
+    Plays random games batchSize at a time.
+
+    Instance variables:
+        boards:     (batchSize, boardSize, boardSize) int8 array of the games in play
+        near:       near[i, x + 1, y + 1] is True if (x, y) is next to a stone of game i (padded by one cell)
+        moves:      moves[i, m] is the cell (x * boardSize + y) of move m of game i
+        numMoves:   Moves made in each game
+        players:    The player to move in each game
+        active:     Which slots hold a game in play
+    """
+
+    def __init__(self, boardSize, N, batchSize = 1024, numPlayers = 2, seed = None):
+        self.boardSize = boardSize
+        self.N = N
+        self.batchSize = batchSize
+        self.numPlayers = numPlayers
+        self.random = np.random.RandomState(seed)
+        self.boards = np.full((batchSize, boardSize, boardSize), EMPTY, dtype = np.int8)
+        self.near = np.zeros((batchSize, boardSize + 2, boardSize + 2), dtype = bool)
+        self.moves = np.zeros((batchSize, boardSize * boardSize), dtype = np.int16)
+        self.numMoves = np.zeros(batchSize, dtype = np.int32)
+        self.players = np.zeros(batchSize, dtype = np.int8)
+        self.active = np.zeros(batchSize, dtype = bool)
+
+    def reset(self, slots):
+        """
+        Start new games in slots (an array of slot indices).
+        """
+        self.boards[slots] = EMPTY
+        self.near[slots] = False
+        self.numMoves[slots] = 0
+        self.players[slots] = 0
+        self.active[slots] = True
+
+    def sampleMoves(self, slots):
+        """
+        Returns (xs, ys) of a random legal move in each of slots, all at once.
+        """
+        size = self.boardSize
+        legal = (self.near[slots, 1:-1, 1:-1] & (self.boards[slots] == EMPTY)).reshape(len(slots), -1)
+        # Pick the r-th legal cell of each game, r uniform below the number of legal cells
+        counts = np.cumsum(legal, axis = 1, dtype = np.int16)
+        r = (self.random.random_sample(len(slots)) * counts[:, -1]).astype(np.int16)
+        cells = (counts <= r[:, None]).sum(axis = 1)
+        xs = cells // size
+        ys = cells % size
+        # An empty board has no cell next to a stone: the first move is in the middle
+        first = self.numMoves[slots] == 0
+        xs[first] = (size + 1) / 2
+        ys[first] = (size + 1) / 2
+        return (xs, ys)
+
+    def isWin(self, slots, xs, ys, players):
+        """
+        Returns a boolean array of whether the stone just placed at (xs, ys) makes N in a row.
+        """
+        size = self.boardSize
+        boards = self.boards
+        wins = np.zeros(len(slots), dtype = bool)
+        for dx, dy in BitBoard.DIRECTIONS:
+            runs = np.ones(len(slots), dtype = np.int32)
+            for sign in (1, -1):
+                alive = np.ones(len(slots), dtype = bool)
+                for k in range(1, self.N):
+                    cx = xs + sign * k * dx
+                    cy = ys + sign * k * dy
+                    inside = (cx >= 0) & (cx < size) & (cy >= 0) & (cy < size)
+                    alive &= inside & (boards[slots, np.clip(cx, 0, size - 1), np.clip(cy, 0, size - 1)] == players)
+                    if not alive.any():
+                        break
+                    runs += alive
+            wins |= runs >= self.N
+        return wins
+
+    def step(self):
+        """
+        Makes one move in every active game.
+        Returns a list of (slot, winner) of the games that ended, winner -1 for a tie.
+        """
+        slots = np.nonzero(self.active)[0]
+        if len(slots) == 0:
+            return []
+        players = self.players[slots]
+        xs, ys = self.sampleMoves(slots)
+        self.boards[slots, xs, ys] = players
+        self.moves[slots, self.numMoves[slots]] = xs * self.boardSize + ys
+        self.numMoves[slots] += 1
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.near[slots, xs + 1 + dx, ys + 1 + dy] = True
+
+        wins = self.isWin(slots, xs, ys, players)
+        full = self.numMoves[slots] == self.boardSize * self.boardSize
+        self.players[slots] = (players + 1) % self.numPlayers
+
+        ended = wins | full
+        self.active[slots[ended]] = False
+        return [(int(slot), int(player) if win else -1)
+                for slot, player, win in zip(slots[ended], players[ended], wins[ended])]
+
+    def gameMoves(self, slot):
+        """
+        Returns the moves of the game in slot as a list of (x, y).
+        """
+        size = self.boardSize
+        return [(int(cell) // size, int(cell) % size) for cell in self.moves[slot, :self.numMoves[slot]]]
+
+    def run(self, numGames):
+        """
+        Plays numGames games and yields (winner, moves) of each as it ends
+        (not in the order they were started).
+        """
+        started = min(numGames, self.batchSize)
+        self.active[:] = False
+        self.reset(np.arange(started))
+        while self.active.any():
+            ended = self.step()
+            for slot, winner in ended:
+                yield (winner, self.gameMoves(slot))
+            # Refill the slots of the finished games
+            refill = [slot for slot, _ in ended][:numGames - started]
+            if refill:
+                self.reset(np.array(refill))
+                started += len(refill)
+
+if __name__ == '__main__':
+    options = parseOptions(sys.argv[1:])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 3:
+        print "Usage: python batchSimulator.py boardSize N numGames [--batch=K] [--record=file] [--seed=S]"
+    else:
+        boardSize = int(args[0])
+        N = int(args[1])
+        numGames = int(args[2])
+        seed = int(options['seed']) if 'seed' in options else None
+        simulator = BatchSimulator(boardSize, N, int(options.get('batch', 1024)), seed = seed)
+        recordWriter = GameRecordWriter(options['record']) if 'record' in options else None
+        wins = {}
+        numMoves = 0
+        startTime = time.time()
+        for winner, moves in simulator.run(numGames):
+            wins[winner] = wins.get(winner, 0) + 1
+            numMoves += len(moves)
+            if recordWriter != None:
+                recordWriter.write(boardSize, N, 2, ['RandomAgent', 'RandomAgent'], moves, winner)
+        elapsed = time.time() - startTime
+        if recordWriter != None:
+            recordWriter.close()
+        print "Games: " + str(numGames) + ", moves: " + str(numMoves) + " in " + ("%.2f" % elapsed) + "s, " + \
+            ("%.0f" % (numMoves / max(elapsed, 1e-9))) + " moves per second"
+        print "Wins: " + ', '.join(str(winner) + ': ' + str(wins[winner]) for winner in sorted(wins))
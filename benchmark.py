@@ -0,0 +1,263 @@
+"""
+Benchmarks of the engine's hot paths on fixed, seeded positions.
+
+For every game configuration (board size and N), a set of positions is made
+by random play from a fixed seed, so every run measures the same work. Each
+benchmark is run on all the positions, repeatedly for at least minTime
+seconds, and the best of a few repeats is reported in operations per second:
+    makeMove            makeMove and undoMove of every legal action
+    generateSuccessor   The successor of one legal action
+    getLegalActions     The legal actions of the position
+    evaluation          MinimaxAgent.evaluationFunction with the learned weights of WEIGHTS_FILE
+    evaluationHardCoded The same with the hard coded weights
+    selectActions       MinimaxAgent.selectActions of the player to move
+    getActionDepthD     MinimaxAgent.getAction with depth D
+    perft               Positions reached by every sequence of legal actions, perftDepth
+                        plies deep. The node count is kept too, as a check that the
+                        move generation did not change.
+
+Each repeat is preceded by a short run of a fixed calibration workload, and
+the speed relative to it is kept too, so that a machine running faster or
+slower than when the baseline was taken does not show up as a change.
+
+Results are written as JSON, and can be compared with a stored baseline:
+    python benchmark.py [--output=file] [--compare=baseline] [--tolerance=T]
+                        [--only=name,...] [--quick] [--seed=S] [--perftDepth=D]
+With --compare the exit status is 1 if any benchmark is more than tolerance
+(default 0.1) slower than the baseline, or a perft count differs. --quick runs
+are too short to compare, so --compare needs a full run.
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import platform
+from gameState import GameState
+from agents import MinimaxAgent
+from util import parseOptions
+
+CONFIGS = [(9, 4), (9, 5), (15, 5), (19, 5)]
+NUM_POSITIONS = 16
+NUM_SEARCH_POSITIONS = 4 # positions of the getAction benchmarks
+SEARCH_DEPTHS = [1, 2, 3]
+MIN_TIME = 0.5
+# Learned weights that ship with the repository
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weightVector After 500 plays against itself.p')
+NUM_REPEATS = 5
+
+def makePositions(boardSize, N, count, seed):
+    """
+    Returns count positions of random play from the empty board, of boardSize / 2
+    to 2 * boardSize moves, none of them finished. The same seed gives the same positions.
+    """
+    rand = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = GameState(N, boardSize, 2)
+        numMoves = rand.randint(boardSize / 2, 2 * boardSize)
+        for i in range(numMoves):
+            move = rand.choice(sorted(state.getLegalActions()))
+            state.makeMove(i % 2, move)
+            if state.gameEnded():
+                state.undoMove()
+                break
+        # A fresh copy, without the undo history of the random play
+        positions.append(GameState(N, boardSize, 2, prevState = state))
+    return positions
+
+def perft(state, depth):
+    """
+    Returns the number of positions reached from state by every sequence of
+    depth legal actions (finished games are not continued).
+    """
+    if depth == 0 or state.gameEnded():
+        return 1
+    player = state.currentPlayer
+    nodes = 0
+    for action in state.getLegalActions():
+        state.makeMove(player, action)
+        nodes += perft(state, depth - 1)
+        state.undoMove()
+    return nodes
+
+def makeBenchmarks(positions, perftDepth):
+    """
+    Returns a list of (name, function), where function runs the benchmark once
+    on every position and returns the number of operations.
+    """
+    learned = MinimaxAgent(0, False, weightsFile = WEIGHTS_FILE)
+    hardCoded = MinimaxAgent(0, False, hardCodedWeights = True)
+
+    def makeMoves():
+        numOps = 0
+        for state in positions:
+            player = state.currentPlayer
+            for action in state.getLegalActions():
+                state.makeMove(player, action)
+                state.undoMove()
+                numOps += 1
+        return numOps
+
+    def generateSuccessors():
+        for state in positions:
+            state.generateSuccessor(state.currentPlayer, min(state.getLegalActions()))
+        return len(positions)
+
+    def getLegalActions():
+        for state in positions:
+            state.getLegalActions()
+        return len(positions)
+
+    def evaluate(agent):
+        def run():
+            for state in positions:
+                agent.evaluationFunction(state)
+            return len(positions)
+        return run
+
+    def selectActions():
+        for state in positions:
+            learned.selectActions(state, state.getLegalActions(), state.currentPlayer)
+        return len(positions)
+
+    def getAction(depth):
+        # A small table: it is cleared before every search, so repeats do the same work
+        agent = MinimaxAgent(0, False, depth = depth, ttMemoryMB = 1, weightsFile = WEIGHTS_FILE)
+        def run():
+            random.seed(0) # ties between moves are broken at random
+            for state in positions[:NUM_SEARCH_POSITIONS]:
+                agent.index = state.currentPlayer
+                agent.transpositionTable.clear()
+                agent.history = {}
+                agent.getAction(state)
+            return NUM_SEARCH_POSITIONS
+        return run
+
+    benchmarks = [('makeMove', makeMoves),
+                  ('generateSuccessor', generateSuccessors),
+                  ('getLegalActions', getLegalActions),
+                  ('evaluation', evaluate(learned)),
+                  ('evaluationHardCoded', evaluate(hardCoded)),
+                  ('selectActions', selectActions)]
+    for depth in SEARCH_DEPTHS:
+        benchmarks.append(('getActionDepth' + str(depth), getAction(depth)))
+    benchmarks.append(('perft', lambda: sum(perft(state, perftDepth) for state in positions)))
+    return benchmarks
+
+def calibration():
+    """
+    A fixed piece of plain Python work, timed next to every benchmark so that
+    results can be compared across runs on a machine whose speed drifts.
+    """
+    table = {}
+    for i in range(2000):
+        table[(i, i % 7)] = table.get((i - 1, (i - 1) % 7), 0) + i
+    return 1
+
+def timeCalls(function, minTime):
+    """
+    Returns the operations per second of calling function for at least minTime seconds,
+    and the operations of the last call.
+    """
+    ops = 0
+    startTime = time.time()
+    while True:
+        callOps = function()
+        ops += callOps
+        elapsed = time.time() - startTime
+        if elapsed >= minTime:
+            break
+    return (ops / max(elapsed, 1e-9), callOps)
+
+def measure(function, minTime, numRepeats):
+    """
+    Returns (best operations per second of numRepeats runs of at least minTime seconds,
+    best ratio of those to the calibration speed measured just before each run,
+    operations of one call of function).
+    """
+    best = 0.0
+    bestRelative = 0.0
+    numOps = None
+    for _ in range(numRepeats):
+        calibrationSpeed, _ = timeCalls(calibration, minTime / 4)
+        opsPerSecond, numOps = timeCalls(function, minTime)
+        best = max(best, opsPerSecond)
+        bestRelative = max(bestRelative, opsPerSecond / calibrationSpeed)
+    return (best, bestRelative, numOps)
+
+def runBenchmarks(seed = 0, only = None, minTime = MIN_TIME, numRepeats = NUM_REPEATS, perftDepth = 2):
+    """
+    Runs the benchmarks (only those named in only, if given) and returns the results
+    as a dictionary, printing them as they come.
+    """
+    results = {}
+    for boardSize, N in CONFIGS:
+        config = str(boardSize) + 'x' + str(boardSize) + ' N=' + str(N)
+        positions = makePositions(boardSize, N, NUM_POSITIONS, seed)
+        configResults = {}
+        for name, function in makeBenchmarks(positions, perftDepth):
+            if only != None and not name in only:
+                continue
+            opsPerSecond, relative, numOps = measure(function, minTime, numRepeats)
+            configResults[name] = {'opsPerSecond': opsPerSecond, 'relative': relative}
+            if name == 'perft':
+                configResults[name]['nodes'] = numOps
+            print "%-12s %-22s %14.1f ops/s" % (config, name, opsPerSecond)
+        results[config] = configResults
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'seed': seed,
+                     'perftDepth': perftDepth, 'numPositions': NUM_POSITIONS, 'time': time.time()},
+            'results': results}
+
+def compare(results, baseline, tolerance):
+    """
+    Prints every benchmark against baseline. Returns the number of regressions:
+    benchmarks more than tolerance slower, and perft counts that differ.
+    """
+    numRegressions = 0
+    print "================= Comparison with baseline ==================="
+    print "%-12s %-22s %14s %14s %8s" % ('Config', 'Benchmark', 'Baseline', 'Now', 'Change')
+    for config in sorted(results['results']):
+        if not config in baseline['results']:
+            continue
+        for name in sorted(results['results'][config]):
+            old = baseline['results'][config].get(name)
+            if old == None:
+                continue
+            new = results['results'][config][name]
+            if 'relative' in old and 'relative' in new:
+                # Measured against the calibration, so a slower or faster machine cancels out
+                ratio = new['relative'] / max(old['relative'], 1e-12)
+            else:
+                ratio = new['opsPerSecond'] / max(old['opsPerSecond'], 1e-9)
+            note = ''
+            if ratio < 1 - tolerance:
+                note = ' SLOWER'
+                numRegressions += 1
+            if 'nodes' in old and 'nodes' in new and old['nodes'] != new['nodes'] and \
+                    results['meta']['perftDepth'] == baseline['meta']['perftDepth']:
+                note += ' NODES ' + str(old['nodes']) + ' != ' + str(new['nodes'])
+                numRegressions += 1
+            print "%-12s %-22s %14.1f %14.1f %+7.1f%%%s" % (config, name, old['opsPerSecond'], new['opsPerSecond'],
+                                                           (ratio - 1) * 100, note)
+    print str(numRegressions) + " regressions (tolerance " + str(tolerance * 100) + "%)"
+    return numRegressions
+
+if __name__ == '__main__':
+    options = parseOptions(sys.argv[1:])
+    quick = '--quick' in sys.argv[1:]
+    if quick and 'compare' in options:
+        print "--quick runs are too noisy to compare with a baseline, run without --quick"
+        sys.exit(2)
+    only = options['only'].split(',') if 'only' in options else None
+    results = runBenchmarks(int(options.get('seed', 0)), only, MIN_TIME / 4 if quick else MIN_TIME,
+                            1 if quick else NUM_REPEATS, int(options.get('perftDepth', 2)))
+    if 'output' in options:
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+    if 'compare' in options:
+        with open(options['compare']) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, float(options.get('tolerance', 0.1))) > 0:
+            sys.exit(1)
@@ -0,0 +1,133 @@
+class BitBoard():
+    """
+    A Gomoku board stored as one integer bitmask per player.
+
+    Cell (x, y) lives at bit y * (boardSize + 1) + x. The extra column at
+    x == boardSize is never set, so shifting a mask by one of the four
+    direction steps cannot wrap a run from one row onto the next.
+
+    The class behaves like the old dictionary of (position => player index),
+    so `move in board`, `board[move]`, `len(board)` and iteration still work.
+
+    Instance variables:
+        boardSize:  The board is boardSize x boardSize
+        numPlayers: Number of players
+        width:      Padded row width (boardSize + 1)
+        masks:      List of bitmasks, one per player
+        occupied:   Bitmask of all stones on the board
+        numPieces:  Number of stones on the board
+    """
+
+    # Horizontal, Vertical, Diagonal /, Diagonal \
+    DIRECTIONS = [(1, 0), (0, 1), (1, 1), (-1, 1)]
+
+    def __init__(self, boardSize, numPlayers, prevBoard = None):
+        self.boardSize = boardSize
+        self.numPlayers = numPlayers
+        self.width = boardSize + 1
+        self.shifts = [dy * self.width + dx for dx, dy in self.DIRECTIONS]
+
+        if prevBoard == None:
+            self.masks = [0] * numPlayers
+            self.occupied = 0
+            self.numPieces = 0
+        else:
+            self.masks = list(prevBoard.masks)
+            self.occupied = prevBoard.occupied
+            self.numPieces = prevBoard.numPieces
+
+    def bit(self, move):
+        return 1 << (move[1] * self.width + move[0])
+
+    def withinBounds(self, move):
+        x, y = move
+        return 0 <= x < self.boardSize and 0 <= y < self.boardSize
+
+    def place(self, player, move):
+        b = self.bit(move)
+        self.masks[player] |= b
+        self.occupied |= b
+        self.numPieces += 1
+
+    def remove(self, player, move):
+        b = self.bit(move)
+        self.masks[player] &= ~b
+        self.occupied &= ~b
+        self.numPieces -= 1
+
+    def playerAt(self, move):
+        """
+        Returns the index of the player at move, -1 if it is empty or off the board.
+        """
+        if not self.withinBounds(move):
+            return -1
+        b = self.bit(move)
+        if not self.occupied & b:
+            return -1
+        for player in range(self.numPlayers):
+            if self.masks[player] & b:
+                return player
+        return -1
+
+    def isWin(self, player, move, N):
+        """
+        Returns True if the stone of player at move is part of N in a row.
+        Only runs that cover move are counted.
+        """
+        mask = self.masks[player]
+        b = self.bit(move)
+        for shift in self.shifts:
+            # A bit survives only if it starts a run of at least N stones
+            run = mask
+            for k in range(1, N):
+                run &= mask >> (shift * k)
+                if not run:
+                    break
+            if not run:
+                continue
+            # Any surviving start within N - 1 steps behind move covers move
+            for k in range(N):
+                if (b >> (shift * k)) & run:
+                    return True
+        return False
+
+    # Dictionary interface, so the board can stand in for (position => player index)
+    def __contains__(self, move):
+        return self.withinBounds(move) and (self.occupied & self.bit(move)) != 0
+
+    def __getitem__(self, move):
+        player = self.playerAt(move)
+        if player == -1:
+            raise KeyError(move)
+        return player
+
+    def __setitem__(self, move, player):
+        if move in self:
+            self.remove(self[move], move)
+        self.place(player, move)
+
+    def __len__(self):
+        return self.numPieces
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, move, default = None):
+        player = self.playerAt(move)
+        if player == -1:
+            return default
+        return player
+
+    def keys(self):
+        return [move for move, _ in self.items()]
+
+    def items(self):
+        result = []
+        for player in range(self.numPlayers):
+            mask = self.masks[player]
+            while mask:
+                low = mask & -mask
+                index = low.bit_length() - 1
+                result.append(((index % self.width, index // self.width), player))
+                mask ^= low
+        return result
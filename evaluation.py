@@ -0,0 +1,131 @@
+"""
+Linear evaluation of learned weights over dense feature counts.
+
+GameState keeps the count of each (player, description) feature in a flat list,
+GameState.featureCounts, indexed by slot:
+    slot = (player * 2 + blockedIndex) * (boardSize + 1) + num
+where blockedIndex is 0 for 'open num' and 1 for 'blocked num' (the layout of
+batchFeatures.featureCounts, flattened).
+
+Learned weights are keyed by (description, num, isSelf, isTurn) (see GameState.getFeatures).
+LinearEvaluator compiles them once into tables indexed by slot and count, so
+evaluating a state is a sum over a few list lookups. A key counts once however
+many opponents have the feature, as in the dot product of the set of
+GameState.getFeatures keys with the weights.
+"""
+
+_slots = {}
+
+def getFeatureSlots(boardSize, numPlayers):
+    """
+    Returns a dictionary of ((player, description) => slot) for every feature
+    a game can have. Built once for each board.
+    """
+    key = (boardSize, numPlayers)
+    if key not in _slots:
+        slots = {}
+        for player in range(numPlayers):
+            for blockedIndex, kind in enumerate(['open ', 'blocked ']):
+                for num in range(boardSize + 1):
+                    slots[(player, kind + str(num))] = (player * 2 + blockedIndex) * (boardSize + 1) + num
+        _slots[key] = slots
+    return _slots[key]
+
+def numFeatureSlots(boardSize, numPlayers):
+    return numPlayers * 2 * (boardSize + 1)
+
+class LinearEvaluator():
+    """
+    Learned weights compiled for one agent and one board.
+
+    Instance variables:
+        weights:     The dictionary of (weight key => weight) it was compiled from
+        tables:      tables[isTurn][slot][count] is the weight of count instances of the
+                     slot's feature. Counts past the end of a list have weight 0.
+        activeSlots: The slots with any nonzero weight
+        opponentTables: With more than two players, the weights of the opponents' features:
+                     opponentTables[isTurn][offset][count], where offset is the slot
+                     past an opponent's first slot
+        opponentSlots: The offsets with any nonzero weight
+    """
+
+    def __init__(self, weights, index, boardSize, numPlayers):
+        self.weights = weights
+        self.index = index
+        self.boardSize = boardSize
+        self.numPlayers = numPlayers
+
+        slots = getFeatureSlots(boardSize, numPlayers)
+        numSlots = numFeatureSlots(boardSize, numPlayers)
+        self.tables = [[[] for _ in range(numSlots)] for _ in range(2)]
+        self.opponentTables = [[[] for _ in range(numSlots / numPlayers)] for _ in range(2)]
+        active = set()
+        opponents = set()
+        for key, weight in weights.items():
+            if not isinstance(key, tuple) or len(key) != 4 or weight == 0:
+                continue
+            description, num, isSelf, isTurn = key
+            if not isinstance(num, int) or num <= 0:
+                continue
+            # isSelf covers the agent itself, or every other player
+            if isSelf == True or numPlayers == 2:
+                slot = slots.get((index if isSelf == True else 1 - index, description))
+                tables = self.tables
+                slotSet = active
+            else:
+                slot = slots.get((0, description)) # the offset, see evaluate
+                tables = self.opponentTables
+                slotSet = opponents
+            if slot == None:
+                continue
+            row = tables[1 if isTurn == True else 0][slot]
+            if len(row) <= num:
+                row.extend([0] * (num + 1 - len(row)))
+            row[num] = weight
+            slotSet.add(slot)
+        self.activeSlots = sorted(active)
+        self.opponentSlots = sorted(opponents)
+
+    def matches(self, weights, index, boardSize, numPlayers):
+        """
+        Whether this evaluator was compiled from these weights for this agent and board.
+        """
+        return self.weights is weights and self.index == index and \
+            self.boardSize == boardSize and self.numPlayers == numPlayers
+
+    def evaluate(self, state, isTurn = None):
+        """
+        Returns the weighted sum of state's features. isTurn defaults to whether
+        it is the agent's turn in state.
+        """
+        if isTurn == None:
+            isTurn = state.currentPlayer == self.index
+        table = self.tables[1 if isTurn else 0]
+        counts = state.featureCounts
+        score = 0
+        for slot in self.activeSlots:
+            row = table[slot]
+            count = counts[slot]
+            if count < len(row):
+                score += row[count]
+        if self.opponentSlots:
+            # Opponents with the same count of a feature make one key, weighed once
+            opponentTable = self.opponentTables[1 if isTurn else 0]
+            seen = set()
+            playerSlots = 2 * (self.boardSize + 1)
+            for player in range(self.numPlayers):
+                if player == self.index:
+                    continue
+                for slot in self.opponentSlots:
+                    row = opponentTable[slot]
+                    count = counts[player * playerSlots + slot]
+                    if 0 < count < len(row) and not (slot, count) in seen:
+                        seen.add((slot, count))
+                        score += row[count]
+        return score
+
+    def weight(self, isTurn, slot, count):
+        row = self.tables[1 if isTurn else 0][slot]
+        if count < len(row):
+            return row[count]
+        return 0
@@ -0,0 +1,162 @@
+"""
+Structured event trace of games, in place of debug prints.
+
+A Tracer passes the events up to its level on to a sink:
+    NullSink            Drops everything (the default, and no event is even made)
+    BufferedFileSink    Lines of text, written bufferSize bytes at a time
+    JSONLSink           One JSON object per line, serialized and written by a background thread
+Neither file sink makes the caller wait for the disk: the first writes whole
+buffers, the second only puts the event on a queue.
+
+Levels, each including the ones before it:
+    GAME      Start and end of every game
+    MOVE      Every move, with the time it took
+    FEATURES  The feature changes of every move
+    BOARD     The board after every move
+
+Sinks are named as 'null', 'file:path' or 'jsonl:path' (see makeTracer).
+"""
+
+import json
+import time
+import threading
+import Queue
+
+OFF = 0
+GAME = 1
+MOVE = 2
+FEATURES = 3
+BOARD = 4
+LEVELS = {'off': OFF, 'game': GAME, 'move': MOVE, 'features': FEATURES, 'board': BOARD}
+
+class NullSink():
+    def write(self, event):
+        pass
+
+    def close(self):
+        pass
+
+class BufferedFileSink():
+    """
+    Writes events as lines of 'time kind key=value ...', bufferSize bytes at a time.
+    """
+
+    def __init__(self, path, bufferSize = 1 << 16):
+        self.file = open(path, 'a')
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.bufferedBytes = 0
+
+    def write(self, event):
+        line = ('%.6f' % event['time']) + ' ' + event['event'] + ''.join(
+            ' ' + key + '=' + str(value) for key, value in sorted(event.items()) if key != 'time' and key != 'event') + '\n'
+        self.buffer.append(line)
+        self.bufferedBytes += len(line)
+        if self.bufferedBytes >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+        self.bufferedBytes = 0
+
+    def close(self):
+        if self.file != None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+class JSONLSink():
+    """
+    Writes events as JSON lines from a background thread. write only puts the
+    event on a queue, so events must not be changed after they are written.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target = self.writeEvents)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, event):
+        self.queue.put(event)
+
+    def writeEvents(self):
+        while True:
+            # Everything that is waiting is written at once
+            events = [self.queue.get()]
+            try:
+                while len(events) < 4096:
+                    events.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            finished = events[-1] == None
+            self.file.write(''.join(json.dumps(event, sort_keys = True) + '\n' for event in events if event != None))
+            self.file.flush()
+            if finished:
+                return
+
+    def close(self):
+        if self.thread != None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.file.close()
+
+class Tracer():
+    """
+    Instance variables:
+        level: Events above this level are not passed on. Check enabled(level)
+               before making an expensive event.
+    """
+
+    def __init__(self, sink = None, level = MOVE):
+        self.sink = sink if sink != None else NullSink()
+        self.level = level if sink != None else OFF
+
+    def enabled(self, level):
+        return level <= self.level
+
+    def event(self, level, kind, **fields):
+        """
+        Pass on an event of kind with fields (JSON serializable values) if level is enabled.
+        """
+        if level <= self.level:
+            fields['event'] = kind
+            fields['time'] = time.time()
+            self.sink.write(fields)
+
+    def close(self):
+        self.sink.close()
+
+def makeTracer(spec, level = MOVE):
+    """
+    Returns a Tracer of a sink named 'null', 'file:path' or 'jsonl:path' (None is 'null').
+    level is a level or its name.
+    """
+    if not isinstance(level, int):
+        if not level in LEVELS:
+            raise ValueError('Invalid trace level ' + str(level) + ', one of ' + ', '.join(sorted(LEVELS)))
+        level = LEVELS[level]
+    if spec == None or spec == 'null':
+        return Tracer()
+    kind, _, path = spec.partition(':')
+    if kind == 'file' and path:
+        return Tracer(BufferedFileSink(path), level)
+    if kind == 'jsonl' and path:
+        return Tracer(JSONLSink(path), level)
+    raise ValueError('Invalid trace sink ' + spec + ', one of null, file:path, jsonl:path')
+
+def featureChanges(oldFeatures, newFeatures):
+    """
+    Returns a dictionary of ('player description' => change in number) of the
+    features (as in GameState.features) that differ between two states.
+    """
+    changes = {}
+    for feature in set(oldFeatures) | set(newFeatures):
+        change = newFeatures.get(feature, 0) - oldFeatures.get(feature, 0)
+        if change != 0:
+            changes[str(feature[0]) + ' ' + feature[1]] = change
+    return changes
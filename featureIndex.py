@@ -0,0 +1,131 @@
+class FeatureIndex():
+    """
+    Stores every feature instance (a run of stones, such as one open 3) once,
+    under an integer id, and maps each position to the ids of the instances
+    it belongs to.
+
+    Successor states share the structure copy-on-write: rows of the position
+    table and chunks of the instance table are only copied by the state that
+    first writes to them, so adding or deleting an instance touches
+    O(run length) entries instead of copying the whole structure.
+
+    Lookups by position still look like the old positionToFeatures dictionary:
+    index[position] is a dict of ((player index, description) => set of frozensets of pieces).
+
+    Instance variables:
+        boardSize: The board is boardSize x boardSize
+        rows:      rows[y][x] is a tuple of the instance ids at (x, y)
+        chunks:    chunks[id // CHUNK_SIZE] is a dict of (id => (feature, frozenset of pieces))
+        nextId:    The id of the next instance that is added
+    """
+
+    CHUNK_SIZE = 64
+
+    def __init__(self, boardSize, prevIndex = None):
+        self.boardSize = boardSize
+
+        if prevIndex == None:
+            self.rows = [[()] * boardSize for _ in range(boardSize)]
+            self.chunks = []
+            self.nextId = 0
+            self.ownedRows = [True] * boardSize
+            self.ownedChunks = set()
+        else:
+            self.rows = list(prevIndex.rows)
+            self.chunks = list(prevIndex.chunks)
+            self.nextId = prevIndex.nextId
+            # Both sides now share everything, so neither may write in place
+            self.ownedRows = [False] * boardSize
+            self.ownedChunks = set()
+            prevIndex.ownedRows = [False] * boardSize
+            prevIndex.ownedChunks = set()
+
+    def writableRow(self, y):
+        if not self.ownedRows[y]:
+            self.rows[y] = list(self.rows[y])
+            self.ownedRows[y] = True
+        return self.rows[y]
+
+    def writableChunk(self, c):
+        while c >= len(self.chunks):
+            self.chunks.append({})
+            self.ownedChunks.add(len(self.chunks) - 1)
+        if not c in self.ownedChunks:
+            self.chunks[c] = dict(self.chunks[c])
+            self.ownedChunks.add(c)
+        return self.chunks[c]
+
+    def add(self, feature, pieces, instanceId = None):
+        """
+        Add an instance of feature made of the frozenset pieces.
+        Returns its id. instanceId is only given when an instance is restored.
+        """
+        if instanceId == None:
+            instanceId = self.nextId
+        self.nextId = max(self.nextId, instanceId + 1)
+        self.writableChunk(instanceId // self.CHUNK_SIZE)[instanceId] = (feature, pieces)
+        for x, y in pieces:
+            row = self.writableRow(y)
+            row[x] = row[x] + (instanceId,)
+        return instanceId
+
+    def remove(self, instanceId):
+        """
+        Remove the instance with the given id.
+        Returns its (feature, pieces).
+        """
+        chunk = self.writableChunk(instanceId // self.CHUNK_SIZE)
+        feature, pieces = chunk.pop(instanceId)
+        for x, y in pieces:
+            row = self.writableRow(y)
+            row[x] = tuple(i for i in row[x] if i != instanceId)
+        # Ids are handed out in order, so undoing the newest add frees its id
+        if instanceId == self.nextId - 1:
+            self.nextId = instanceId
+        return (feature, pieces)
+
+    def idsAt(self, position):
+        return self.rows[position[1]][position[0]]
+
+    def instance(self, instanceId):
+        return self.chunks[instanceId // self.CHUNK_SIZE][instanceId]
+
+    def find(self, position, feature, pieces):
+        """
+        Returns the id of the instance of feature made of pieces at position, None if there is none.
+        """
+        for instanceId in self.idsAt(position):
+            if self.instance(instanceId) == (feature, pieces):
+                return instanceId
+        return None
+
+    # Dictionary interface, in the shape of the old positionToFeatures
+    def __contains__(self, position):
+        x, y = position
+        return 0 <= x < self.boardSize and 0 <= y < self.boardSize and len(self.rows[y][x]) > 0
+
+    def __getitem__(self, position):
+        if not position in self:
+            raise KeyError(position)
+        features = {}
+        for instanceId in self.idsAt(position):
+            feature, pieces = self.instance(instanceId)
+            if not feature in features:
+                features[feature] = set()
+            features[feature].add(pieces)
+        return features
+
+    def keys(self):
+        return [(x, y) for y in range(self.boardSize) for x in range(self.boardSize) if self.rows[y][x]]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(position, self[position]) for position in self.keys()]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -0,0 +1,151 @@
+"""
+Append-only binary files of played games.
+
+A record file starts with the magic 'GMKG' and a format version, followed by
+any number of games. Each game is:
+    header:  boardSize, N, numPlayers, winner + 1 (0 for a tie), number of moves,
+             length of the agents string
+    agents:  the agents, as one comma separated ascii string
+    moves:   x, y of every move, one byte each. Players move in turn, starting with player 0.
+
+Games are only ever appended, so a file can collect every game that was played.
+A game cut short by a crash at the end of a file is skipped by the reader.
+"""
+
+import struct
+import sys
+
+MAGIC = 'GMKG'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sI')
+GAME_HEADER = struct.Struct('<BBBBHH')
+
+class GameRecord():
+    """
+    One played game.
+
+    Instance variables:
+        boardSize:  The board is boardSize x boardSize
+        N:          N in a row
+        numPlayers: Number of players
+        agents:     List of agent descriptions (see describeAgent), one per player
+        moves:      List of (x, y), player i % numPlayers made moves[i]
+        winner:     The index of the winner, -1 for a tie
+    """
+
+    __slots__ = ('boardSize', 'N', 'numPlayers', 'agents', 'moves', 'winner')
+
+    def __init__(self, boardSize, N, numPlayers, agents, moves, winner):
+        self.boardSize = boardSize
+        self.N = N
+        self.numPlayers = numPlayers
+        self.agents = agents
+        self.moves = moves
+        self.winner = winner
+
+    def playerMoves(self):
+        """
+        Returns the list of (player, move) in the order they were played.
+        """
+        return [(i % self.numPlayers, move) for i, move in enumerate(self.moves)]
+
+def describeAgent(agent):
+    """
+    A short description of an agent for a record, such as 'MinimaxAgent'.
+    """
+    return agent.__class__.__name__
+
+class GameRecordWriter():
+    """
+    Appends games to a record file. Games are packed into a buffer in memory
+    and written bufferSize bytes at a time, so recording does not slow down play.
+    Call close (or use it in a with statement) to write the rest of the buffer.
+    """
+
+    def __init__(self, path, bufferSize = 1 << 16):
+        self.path = path
+        self.bufferSize = bufferSize
+        self.buffer = bytearray()
+        self.numGames = 0
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, boardSize, N, numPlayers, agents, moves, winner):
+        """
+        Append a game. moves is the list of (x, y) in the order they were played
+        (or of (player, (x, y)), such as Game.moveHistory).
+        """
+        agentsString = ','.join(agents)
+        self.buffer += GAME_HEADER.pack(boardSize, N, numPlayers, winner + 1, len(moves), len(agentsString))
+        self.buffer += agentsString
+        for move in moves:
+            if len(move) == 2 and isinstance(move[1], tuple):
+                move = move[1]
+            self.buffer.append(move[0])
+            self.buffer.append(move[1])
+        self.numGames += 1
+        if len(self.buffer) >= self.bufferSize:
+            self.flush()
+
+    def writeRecord(self, record):
+        self.write(record.boardSize, record.N, record.numPlayers, record.agents, record.moves, record.winner)
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.file != None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def readGameRecords(path):
+    """
+    Generator of the GameRecords in a record file, read one game at a time.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise IOError('Not a game record file (version ' + str(VERSION) + '): ' + path)
+        while True:
+            header = f.read(GAME_HEADER.size)
+            if len(header) < GAME_HEADER.size:
+                return
+            boardSize, N, numPlayers, winner, numMoves, agentsLength = GAME_HEADER.unpack(header)
+            agentsString = f.read(agentsLength)
+            data = bytearray(f.read(2 * numMoves))
+            if len(agentsString) < agentsLength or len(data) < 2 * numMoves:
+                return
+            moves = [(data[i], data[i + 1]) for i in xrange(0, len(data), 2)]
+            agents = agentsString.split(',') if agentsString else []
+            yield GameRecord(boardSize, N, numPlayers, agents, moves, winner - 1)
+
+if __name__ == '__main__':
+    # Prints a summary of a record file: python gameRecord.py games.rec
+    args = sys.argv[1:]
+    if len(args) != 1:
+        print "Usage: python gameRecord.py records"
+    else:
+        numGames = 0
+        numMoves = 0
+        wins = {}
+        for record in readGameRecords(args[0]):
+            numGames += 1
+            numMoves += len(record.moves)
+            wins[record.winner] = wins.get(record.winner, 0) + 1
+        print "Games: " + str(numGames)
+        print "Moves: " + str(numMoves)
+        for winner in sorted(wins):
+            print ("Ties" if winner == -1 else "Player " + str(winner)) + ": " + str(wins[winner])
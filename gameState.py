@@ -1,5 +1,41 @@
 import util
-import copy
+from bitboard import BitBoard
+from featureIndex import FeatureIndex
+from zobrist import getZobristKeys
+from patterns import getPatternTables
+from evaluation import getFeatureSlots, numFeatureSlots
+from symmetry import NUM_SYMMETRIES
+
+class MoveRecord():
+    """
+    Everything makeMove changed, so undoMove can roll it back exactly.
+
+    Instance variables:
+        player, move:       The stone that was placed
+        currentPlayer, gameOver, winner, previousAction, hash, symmetryHashes:
+                            The values before the move
+        removedLegalAction: Whether move was taken out of legalActions
+        addedLegalActions:  Positions that were added to legalActions
+        featureChanges:     List of (feature, +1 or -1) applied to features
+        positionChanges:    List of (added or not, instance id, feature, frozenset of pieces)
+                            applied to positionToFeatures
+    """
+    __slots__ = ('player', 'move', 'currentPlayer', 'gameOver', 'winner', 'previousAction', 'hash',
+                 'symmetryHashes', 'removedLegalAction', 'addedLegalActions', 'featureChanges', 'positionChanges')
+
+    def __init__(self, state, player, move):
+        self.player = player
+        self.move = move
+        self.currentPlayer = state.currentPlayer
+        self.gameOver = state.gameOver
+        self.winner = state.winner
+        self.previousAction = state.previousAction
+        self.hash = state.hash
+        self.symmetryHashes = state.symmetryHashes
+        self.removedLegalAction = False
+        self.addedLegalActions = []
+        self.featureChanges = []
+        self.positionChanges = []
 
 class GameState():
     """
@@ -15,37 +51,57 @@ class GameState():
         N:             N in a row
         boardSize:     The board will be boardSize x boardSize
         numPlayers:    How many total players in this game (including computers)
-        board:         A dictionary of (position => player index)
+        board:         A BitBoard of (position => player index), one bitmask per player
         gameOver:      Whether the game is over or not
         winner:        The index of the winner, -1 if the game is not over
         features:      A dictionary of ((agentIndex, description) => number)
                        Ex. (agentIndex, 'open 3') => 2
                            (agentIndex, 'blocked 4') => 1
+        featureCounts: The same counts as a list indexed by slot, featureSlots[feature]
+                       (see evaluation.py)
+        hash:          Zobrist hash of the stones on the board and the player to move
+        symmetryHashes: symmetryHashes[transform] is the hash of the board after transform
+                       (see symmetry.py), symmetryHashes[0] == hash
+        lineCodes:     lineCodes[player][lineIndex] is the base 3 code of a line seen
+                       from player (see patterns.PatternTables)
+        undoStack:     A list of MoveRecords, one for each makeMove that undoMove can revert
     """
 
     def __init__(self, N, boardSize, numPlayers, prevState = None):
         self.N = N
         self.boardSize = boardSize
         self.numPlayers = numPlayers
+        self.zobristKeys = getZobristKeys(boardSize, numPlayers)
+        self.patterns = getPatternTables(boardSize, N)
+        self.featureSlots = getFeatureSlots(boardSize, numPlayers)
 
         if prevState == None:
-            self.board = {}
+            self.board = BitBoard(boardSize, numPlayers)
             self.legalActions = set()
             self.currentPlayer = 0
             self.gameOver = False
             self.winner = -1
             self.features = {}
-            self.positionToFeatures = dict()
+            self.featureCounts = [0] * numFeatureSlots(boardSize, numPlayers)
+            self.positionToFeatures = FeatureIndex(boardSize)
             self.previousAction = None #(player, action)
+            self.hash = self.zobristKeys.turns[0]
+            self.symmetryHashes = [self.hash] * NUM_SYMMETRIES
+            self.lineCodes = [list(self.patterns.emptyLineCodes) for _ in range(numPlayers)]
         else:
-            self.board = dict(prevState.board)
+            self.board = BitBoard(boardSize, numPlayers, prevState.board)
             self.legalActions = set(prevState.legalActions)
             self.currentPlayer = prevState.currentPlayer
             self.gameOver = prevState.gameOver
             self.winner = prevState.winner
             self.features = dict(prevState.features)
-            self.positionToFeatures = copy.deepcopy(prevState.positionToFeatures)
+            self.featureCounts = list(prevState.featureCounts)
+            self.positionToFeatures = FeatureIndex(boardSize, prevState.positionToFeatures)
             self.previousAction = prevState.previousAction
+            self.hash = prevState.hash
+            self.symmetryHashes = prevState.symmetryHashes
+            self.lineCodes = [list(codes) for codes in prevState.lineCodes]
+        self.undoStack = []
 
     def getLegalActions(self):
         """
@@ -81,7 +137,7 @@ class GameState():
             print "Agent index " + str(playerIndex) + " is invalid."
             return False
         # Out of bounds or that position already has a piece
-        if not self.withinBounds(move) or move in self.board:
+        if not self.withinBounds(move) or self.board.occupied & self.board.bit(move):
             return False
         return True
 
@@ -97,26 +153,90 @@ class GameState():
     def makeMove(self, player, move):
         """
         Player makes a move.
+        Returns True if the move was made (and can be reverted with undoMove).
         """
         if not self.moveIsValid(player, move):
-            return
-        
+            return False
+
+        record = MoveRecord(self, player, move)
+        self.undoStack.append(record)
+        self.previousAction = (player, move)
+
         # Update self.features
-        self.board[move] = player
+        self.board.place(player, move)
         self.updateFeaturesForMove(player, move)
-        if self.checkTie():
+        self.updateLineCodes(player, move, 1)
+        if self.board.isWin(player, move, self.N):
+            self.gameOver = True
+            self.winner = player
+        elif self.checkTie():
             self.gameOver = True
 
-        self.currentPlayer = (self.currentPlayer + 1) % self.numPlayers
+        nextPlayer = (self.currentPlayer + 1) % self.numPlayers
+        cell = move[1] * self.boardSize + move[0]
+        turnKeys = self.zobristKeys.turns[self.currentPlayer] ^ self.zobristKeys.turns[nextPlayer]
+        self.hash ^= self.zobristKeys.pieces[player][cell] ^ turnKeys
+        # A new list each move, so the record keeps the old one
+        self.symmetryHashes = [h ^ key ^ turnKeys for h, key in
+                               zip(self.symmetryHashes, self.zobristKeys.symmetricPieces[player][cell])]
+        self.currentPlayer = nextPlayer
 
         # Update self.legalActions
         x, y = move
         if move in self.legalActions:
             self.legalActions.remove(move)
-        for i in range(x - 1, x + 1 + 1):
-            for j in range(y - 1, y + 1 + 1):
-                if self.withinBounds((i, j)) and (i, j) not in self.board:
+            record.removedLegalAction = True
+        occupied = self.board.occupied
+        width = self.board.width
+        for i in range(max(x - 1, 0), min(x + 1, self.boardSize - 1) + 1):
+            for j in range(max(y - 1, 0), min(y + 1, self.boardSize - 1) + 1):
+                if not occupied & (1 << (j * width + i)) and (i, j) not in self.legalActions:
                     self.legalActions.add((i, j))
+                    record.addedLegalActions.append((i, j))
+        return True
+
+    def undoMove(self):
+        """
+        Revert the last move made with makeMove on this state.
+        """
+        record = self.undoStack.pop()
+
+        for position in record.addedLegalActions:
+            self.legalActions.discard(position)
+        if record.removedLegalAction:
+            self.legalActions.add(record.move)
+
+        for added, instanceId, feature, pieces in reversed(record.positionChanges):
+            if added:
+                self.positionToFeatures.remove(instanceId)
+            else:
+                self.positionToFeatures.add(feature, pieces, instanceId)
+        for feature, change in reversed(record.featureChanges):
+            if change > 0:
+                util.deleteItemFromDict(self.features, feature)
+            else:
+                util.addItemToDict(self.features, feature)
+            self.featureCounts[self.featureSlots[feature]] -= change
+
+        self.board.remove(record.player, record.move)
+        self.updateLineCodes(record.player, record.move, -1)
+        self.currentPlayer = record.currentPlayer
+        self.gameOver = record.gameOver
+        self.winner = record.winner
+        self.previousAction = record.previousAction
+        self.hash = record.hash
+        self.symmetryHashes = record.symmetryHashes
+
+    def getCanonicalHash(self):
+        """
+        Returns (canonical hash, transform): the smallest hash of the 8 symmetries of
+        the position, and the transform that takes this position to the canonical one.
+        Moves are taken to and from the canonical position with symmetry.transformMove
+        and symmetry.inverseTransformMove.
+        """
+        hashes = self.symmetryHashes
+        canonical = min(hashes)
+        return (canonical, hashes.index(canonical))
 
     def getFeatures(self, index):
         # Return the features that we need for evaluationFunction
@@ -158,108 +278,161 @@ class GameState():
         return move[0] >= 0 and move[0] < self.boardSize and move[1] >= 0 and move[1] < self.boardSize
 
     def checkTie(self):
-        if len(self.board.keys()) == self.boardSize**2 :
+        if len(self.board) == self.boardSize**2 :
             return True
         else:
             return False
 
 
+    def updateLineCodes(self, player, move, sign):
+        """
+        Add (sign 1) or remove (sign -1) the stone of player at move in self.lineCodes.
+        """
+        powers = self.patterns.powers
+        for lineIndex, position in self.patterns.cellLines[move[1] * self.boardSize + move[0]]:
+            for p in range(self.numPlayers):
+                digit = 1 if p == player else 2
+                self.lineCodes[p][lineIndex] += sign * digit * powers[position]
+
+    def getMoveShapes(self, player, move):
+        """
+        Returns the shapes (see patterns.py) that player makes on the 4 lines
+        through move by playing there, e.g. [patterns.OPEN_THREE, patterns.NONE, ...].
+        move must be empty.
+        """
+        tables = self.patterns
+        powers = tables.powers
+        half = powers[self.N - 1]
+        codes = self.lineCodes[player]
+        known = tables.shapes
+        shapes = []
+        for lineIndex, position in tables.cellLines[move[1] * self.boardSize + move[0]]:
+            code = codes[lineIndex]
+            window = (code // powers[position - self.N + 1]) % half + (code // powers[position + 1]) % half * half
+            shape = known.get(window)
+            shapes.append(shape if shape != None else tables.shape(window))
+        return shapes
+
     def updateFeaturesForMove(self, player, move):
         """
         Update the features when a player makes a move.
         There are 4 directions (Horizontal, Vertical, Diagonal /, Diagonal \).
         """
-        # import pdb; pdb.set_trace();
+        for lineIndex, position in self.patterns.cellLines[move[1] * self.boardSize + move[0]]:
+            neighbors1 = self.checkNeighboringRows(player, lineIndex, position, 1)
+            neighbors2 = self.checkNeighboringRows(player, lineIndex, position, -1)
+            self.updateFeature(player, move, neighbors1, neighbors2)
 
-        x, y = move
-        # print move
-        # print str(self)
-
-
-        ############ Horizontal ############
-        neighbors1 = self.checkNeighboringRows(move, [(i, y) for i in range(x + 1, self.boardSize + 1)])
-        # print neighbors1
-        neighbors2 = self.checkNeighboringRows(move, [(i, y) for i in range(x - 1, -2, -1)])
-        self.updateFeature(player, move, neighbors1, neighbors2)
-
-        ############ Vertical ############
-        neighbors1 = self.checkNeighboringRows(move, [(x, j) for j in range(y + 1, self.boardSize + 1)])
-        neighbors2 = self.checkNeighboringRows(move, [(x, j) for j in range(y - 1, -2, -1)])
-        self.updateFeature(player, move, neighbors1, neighbors2)
-
-        ############ Diagonal / ############
-        neighbors1 = self.checkNeighboringRows(move, [(x + i, y + i) for i in range(1, self.boardSize + 1)])
-        neighbors2 = self.checkNeighboringRows(move, [(x - i, y - i) for i in range(1, self.boardSize + 1)])
-        self.updateFeature(player, move, neighbors1, neighbors2)
-
-        ############ Diagonal \ ############
-        neighbors1 = self.checkNeighboringRows(move, [(x + i, y - i) for i in range(1, self.boardSize + 1)])
-        neighbors2 = self.checkNeighboringRows(move, [(x - i, y + i) for i in range(1, self.boardSize + 1)])
-        self.updateFeature(player, move, neighbors1, neighbors2)
-
-    def checkNeighboringRows(self, move, piecesRange):
+    def neighborRun(self, player, lineIndex, position, step):
         """
-        Return (player, num in a row, blocked or not)
-        This logic is complicated...
+        Return (player, num in a row, blocked or not) for the run of stones next to
+        position on a line, after it (step 1) or before it (step -1).
+        Reads the run from the line codes with a table lookup.
         """
+        tables = self.patterns
+        powers = tables.powers
+        cell = position + step - tables.PAD
         # Hit boundary (no neighbors)
-        if len(piecesRange) == 0 or not self.withinBounds(piecesRange[0]):
-            return (-1, 0, 1, set())
+        if cell < 0 or cell >= len(tables.lines[lineIndex]):
+            return (-1, 0, 1)
+        digit = (self.lineCodes[player][lineIndex] // powers[position + step]) % 3
         # Open end (no neighbors)
-        if piecesRange[0] not in self.board:
-            return (-1, 0, 0, set())
+        if digit == 0:
+            return (-1, 0, 0)
+        neighbor = player
+        if digit == 2:
+            neighbor = 1 - player if self.numPlayers == 2 else self.board.playerAt(tables.lines[lineIndex][cell])
+
+        code = self.lineCodes[neighbor][lineIndex]
+        window = powers[self.N + 1]
+        if step > 0:
+            num, blocked = tables.runForward[(code // powers[position + 1]) % window]
+        else:
+            num, blocked = tables.runBackward[(code // powers[position - self.N - 1]) % window]
+        return (neighbor, num, blocked)
 
-        piecesInFeature = set()
-        player = self.board[piecesRange[0]]
-        num = 0
-        blocked = 0
-        for piece in piecesRange:
+    def checkNeighboringRows(self, player, lineIndex, position, step):
+        """
+        Return (player, num in a row, blocked or not, piecesInFeature)
+        for the run of stones next to position on a line, after it (step 1) or before it (step -1).
+        """
+        neighbor, num, blocked = self.neighborRun(player, lineIndex, position, step)
+        if num == 0:
+            return (neighbor, num, blocked, set())
+        line = self.patterns.lines[lineIndex]
+        cell = position + step - self.patterns.PAD
+        if step > 0:
+            return (neighbor, num, blocked, set(line[cell:cell + num]))
+        return (neighbor, num, blocked, set(line[cell - num + 1:cell + 1]))
+
+    def getFeatureChanges(self, player, move):
+        """
+        Work out what player playing at move would do, without making the move.
+        Returns (changes, wins), where changes is a dictionary of (feature => change in
+        self.features) and wins is True if the move makes N in a row.
+        Follows the same rules as updateFeature.
+        """
+        changes = {}
+        wins = False
+        for lineIndex, position in self.patterns.cellLines[move[1] * self.boardSize + move[0]]:
+            neighbors1 = self.neighborRun(player, lineIndex, position, 1)
+            neighbors2 = self.neighborRun(player, lineIndex, position, -1)
+            if neighbors1[1] == 0 and neighbors2[1] == 0:
+                continue
 
-            if not self.withinBounds(piece) or (piece in self.board and self.board[piece] != player):
-                blocked = 1
-                break
+            num = 1
+            blocked = 0
+            for neighbor, neighborNum, neighborBlocked in [neighbors1, neighbors2]:
+                if neighbor == -1:
+                    blocked += neighborBlocked
+                    continue
+                if neighbor == player:
+                    num += neighborNum
+                    blocked += neighborBlocked
+                else:
+                    blocked += 1
+                if neighborNum >= 2:
+                    # The neighbor's run loses its feature, and an open run of another player becomes blocked
+                    kind = 'open ' if neighborBlocked == 0 else 'blocked '
+                    feature = (neighbor, kind + str(neighborNum))
+                    changes[feature] = changes.get(feature, 0) - 1
+                    if neighbor != player and neighborBlocked == 0:
+                        feature = (neighbor, 'blocked ' + str(neighborNum))
+                        changes[feature] = changes.get(feature, 0) + 1
+
+            if num >= self.N:
+                wins = True
+            if blocked < 2 and num > 1:
+                feature = (player, ('open ' if blocked == 0 else 'blocked ') + str(num))
+                changes[feature] = changes.get(feature, 0) + 1
+        return (changes, wins)
+
+    def addFeature(self, feature):
+        util.addItemToDict(self.features, feature)
+        self.featureCounts[self.featureSlots[feature]] += 1
+        self.undoStack[-1].featureChanges.append((feature, 1))
 
-            if piece not in self.board:
-                break
-            # print piece
-            piecesInFeature.add(piece)
-            # print piecesInFeature
-            num += 1
-        return (player, num, blocked, piecesInFeature)
+    def deleteFeature(self, feature):
+        util.deleteItemFromDict(self.features, feature)
+        self.featureCounts[self.featureSlots[feature]] -= 1
+        self.undoStack[-1].featureChanges.append((feature, -1))
 
     #Delete an instance of a feature from a set of pieces
     def deleteFeatureFromDict(self, dict, featureToDelete, move, setOfPiecesToDeleteFeatureFrom):
-
-        for piece in setOfPiecesToDeleteFeatureFrom:
-
-            if not piece in self.positionToFeatures:
-                # self.positionToFeatures[move] = {featureToDelete:set()}
-                continue
-            if not featureToDelete in self.positionToFeatures[piece]:
-                # self.positionToFeatures[move][featureToDelete] = set()
-                continue
-            # print piece
-            self.positionToFeatures[piece][featureToDelete].discard(frozenset(setOfPiecesToDeleteFeatureFrom))
-            if len(self.positionToFeatures[piece][featureToDelete]) == 0:
-                del self.positionToFeatures[piece][featureToDelete]
-            if len(self.positionToFeatures[piece]) == 0:
-                del self.positionToFeatures[piece]
+        pieces = frozenset(setOfPiecesToDeleteFeatureFrom)
+        instanceId = dict.find(next(iter(pieces)), featureToDelete, pieces)
+        if instanceId == None:
+            return
+        dict.remove(instanceId)
+        self.undoStack[-1].positionChanges.append((False, instanceId, featureToDelete, pieces))
 
     #Add an instance of a feature for a set of pieces
-    #The structure of the positionToFeatures is:
-    #positionToFeatures - Dict of move : Dict(player index,feature) key,value pairs
-    #Dict(player index, feature) is a dict of (player index, feature) : Set of frozen sets
-    #The set contains frozen sets, where the frozen sets are the pieces that are in one instance of the feature
-    #So the overall structure is dict:dict:set:set of (x,y) coordinates
+    #positionToFeatures is a FeatureIndex, which stores the instance once under an id
+    #and lists that id for every piece in the instance
     def addPiecesToFeatureInDict(self, dict, move, feature, piecesList):
-        # print "Adding feature: ", feature, "| For move: ", move, "| Pieces: ", piecesList
-        for piece in piecesList:
-            if not piece in self.positionToFeatures:
-                self.positionToFeatures[piece] = {feature:set()}
-            if not feature in self.positionToFeatures[piece]:
-                self.positionToFeatures[piece][feature] = set()
-            self.positionToFeatures[piece][feature].update([frozenset(piecesList)])
-        # self.positionToFeatures[move][feature].append(piecesInFeature)
+        pieces = frozenset(piecesList)
+        instanceId = dict.add(feature, pieces)
+        self.undoStack[-1].positionChanges.append((True, instanceId, feature, pieces))
 
     def updateFeature(self, player, move, neighbors1, neighbors2):
         """
@@ -288,17 +461,17 @@ class GameState():
 
                         self.deleteFeatureFromDict(self.positionToFeatures, featureToDelete, move, neighbor[3])                        
 
-                        util.deleteItemFromDict(self.features, featureToDelete)
+                        self.deleteFeature(featureToDelete)
                         featureToAdd = (neighbor[0], 'blocked ' + str(num))
 
                         piecesInFeature = neighbor[3]
                         self.addPiecesToFeatureInDict(self.positionToFeatures, move, featureToAdd, piecesInFeature)
-                        util.addItemToDict(self.features, featureToAdd)
+                        self.addFeature(featureToAdd)
                     else: # blocked
                         featureToDelete = (neighbor[0], 'blocked ' + str(num))
 
                         self.deleteFeatureFromDict(self.positionToFeatures, featureToDelete, move, neighbor[3])                        
-                        util.deleteItemFromDict(self.features, featureToDelete)
+                        self.deleteFeature(featureToDelete)
             else:
                 # neighbor is the same player, so delete the feature
                 if num >= 2:
@@ -306,12 +479,12 @@ class GameState():
                         featureToDelete = (neighbor[0], 'open ' + str(num))
 
                         self.deleteFeatureFromDict(self.positionToFeatures, featureToDelete, move, neighbor[3])                        
-                        util.deleteItemFromDict(self.features, featureToDelete)
+                        self.deleteFeature(featureToDelete)
                     else: # blocked
                         featureToDelete = (neighbor[0], 'blocked ' + str(num))
                         self.deleteFeatureFromDict(self.positionToFeatures, featureToDelete, move, neighbor[3])                        
 
-                        util.deleteItemFromDict(self.features, featureToDelete)
+                        self.deleteFeature(featureToDelete)
 
         # Add a new feature according to the given move and its neighbors.
         num = 1
@@ -341,11 +514,6 @@ class GameState():
             else:
                 blocked += 1
 
-        # Game ends if num >= self.N
-        if num >= self.N:
-            self.gameOver = True
-            self.winner = player
-
         s = ''
         if blocked >= 2 or num <= 1:
             return
@@ -355,6 +523,6 @@ class GameState():
             s = 'blocked ' + str(num)
 
         feature = (player, s)
-        util.addItemToDict(self.features, feature)
+        self.addFeature(feature)
         self.addPiecesToFeatureInDict(self.positionToFeatures, move, feature, piecesInFeature)
         # print "Pieces in feature with: ", move, self.positionToFeatures[move][feature]
@@ -5,30 +5,49 @@ import pickle
 import time
 from gameState import *
 from agents import *
+from mcts import MCTSAgent
 from util import *
+from gameRecord import GameRecordWriter, describeAgent
+from searchStats import SearchStats
+from eventTrace import makeTracer, featureChanges, GAME, MOVE, FEATURES, BOARD
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, recordPath = None, collectStats = False, tracer = None):
         self.agents = []
         self.moveHistory = []
+        # Every finished game is appended to recordPath (see gameRecord.py)
+        self.recordWriter = GameRecordWriter(recordPath) if recordPath != None else None
+        # Minimax agents count what their searches do (see searchStats.py)
+        self.collectStats = collectStats
+        # Events of the games (see eventTrace.py), nothing by default
+        self.tracer = tracer if tracer != None else makeTracer(None)
+        self.numGamesPlayed = 0
 
 
     # Runs a full game until completion
     # Returns a map of statistics, where the keys are:
     # numMoves (int) - the number of moves played by all players
     # avgMoveTime (float) - average time in seconds per move for each player
+    # searchStats (dict) - SearchStats of all moves of each player that collects them
     def runGames(self, gridSize, nInARow, numComputerAgents, numHumanAgents, verboseFlag):
         #Collect statistics on the game
         stats = {}
         numberOfMoves = 0
+        self.moveHistory = []
 
         self.state = GameState(nInARow, gridSize, numComputerAgents + numHumanAgents)
         if verboseFlag:
             print self.state
+        tracer = self.tracer
+        gameNumber = self.numGamesPlayed
+        self.numGamesPlayed += 1
+        tracer.event(GAME, 'gameStart', game = gameNumber, boardSize = gridSize, N = nInARow,
+                     agents = [describeAgent(agent) for agent in self.agents])
 
         agentIndex = 0
         agentTimeTaken = {}
+        agentSearchStats = {}
         while not self.state.gameEnded():
             # Set agent time taken to 0 if this is the first move
             if not agentIndex in agentTimeTaken:
@@ -42,16 +61,22 @@ class Game:
             self.moveHistory.append((agentIndex, action))
             numberOfMoves += 1
             turnEndTime = time.clock()
-            print self.state.positionToFeatures
-            print "-----------------"
+            searchStats = getattr(agent, 'lastSearchStats', None)
+            if searchStats != None:
+                agentSearchStats.setdefault(agentIndex, SearchStats(0)).add(searchStats)
             successorState = self.state.generateSuccessor(agentIndex, action)
             oldState = self.state
             self.state = successorState
 
-            print successorState.positionToFeatures
-            print "-----------------"
-            print oldState.positionToFeatures
-            print "======================"
+            if tracer.enabled(MOVE):
+                tracer.event(MOVE, 'move', game = gameNumber, ply = numberOfMoves, player = agentIndex, move = action,
+                             seconds = turnEndTime - turnStartTime)
+                if tracer.enabled(FEATURES):
+                    tracer.event(FEATURES, 'features', game = gameNumber, ply = numberOfMoves,
+                                 changes = featureChanges(oldState.features, successorState.features))
+                if tracer.enabled(BOARD):
+                    tracer.event(BOARD, 'board', game = gameNumber, ply = numberOfMoves,
+                                 stones = [(x, y, player) for (x, y), player in successorState.board.items()])
 
             if verboseFlag:
                 print self.state
@@ -59,6 +84,10 @@ class Game:
             agentTimeTaken[agentIndex] += turnEndTime - turnStartTime
             agentIndex = (agentIndex + 1) % len(self.agents)
 
+        if self.recordWriter != None:
+            self.recordWriter.write(gridSize, nInARow, len(self.agents), [describeAgent(agent) for agent in self.agents],
+                                    self.moveHistory, self.state.getWinner())
+
         print "Game has ended!"
         if self.state.getWinner() == -1:
             print "The game was a tie."
@@ -75,6 +104,9 @@ class Game:
         stats["winner"] = self.state.getWinner()
         stats["numMoves"] = numberOfMoves
         stats["avgMoveTime"] = dict((agent, agentTimeTaken[agent]/(numberOfMovesPerPlayer + oneMoreMove(agent, lastPlayer))) for agent in agentTimeTaken)
+        stats["searchStats"] = agentSearchStats
+        tracer.event(GAME, 'gameEnd', game = gameNumber, winner = stats["winner"], numMoves = numberOfMoves,
+                     avgMoveTime = stats["avgMoveTime"])
         # stats["moveHistory"] = self.moveHistory
         return stats
 
@@ -93,6 +125,12 @@ class Game:
         # numGames - Number of games to play
         # verboseFlag - Print boards for each turn and other turn data. "verbose" will turn this on (default: False)
         # agentTypes - a string of structure 'mrmm', where each letter defines the AI agent type. m - Minimax. r - random
+        #              h - Minimax with hard coded weights. t - Minimax with a time limit per move
+        #              u - Monte Carlo tree search (1000 playouts per move)
+        # --record=file - Append every game played to file (see gameRecord.py)
+        # --stats - Collect search statistics of the minimax agents, printed at the end
+        # --trace=sink - Trace the games to a sink: null, file:path or jsonl:path (see eventTrace.py)
+        # --traceLevel=level - game, move (default), features or board
     def repl(self, args):
         #Defaults
         numArgs = 7
@@ -114,6 +152,12 @@ class Game:
         numGames - Number of games to play
         verboseFlag - Print boards for each turn and other turn data. "verbose" will turn this on (default: False)
         agentTypes - a string of structure 'mrmm', where each letter defines the AI agent type. m - Minimax. r - random
+                     h - Minimax with hard coded weights. t - Minimax with a time limit per move
+                     u - Monte Carlo tree search (1000 playouts per move)
+        --record=file - Append every game played to file (see gameRecord.py)
+        --stats - Collect search statistics of the minimax agents, printed at the end
+        --trace=sink - Trace the games to a sink: null, file:path or jsonl:path (see eventTrace.py)
+        --traceLevel=level - game, move (default), features or board
         '''
 
         #Parse arguments
@@ -150,11 +194,16 @@ class Game:
                 queryString = args[6]
                 agentType = None
                 if queryString[i] == "m":
-                    agentType = MinimaxAgent(len(self.agents), verbose)
+                    agentType = MinimaxAgent(len(self.agents), verbose, collectStats = self.collectStats)
                 elif queryString[i] == "r":
                     agentType = RandomAgent(len(self.agents), verbose)
                 elif queryString[i] == "h":
-                    agentType = MinimaxAgent(len(self.agents), verbose, depth = 3, hardCodedWeights = True)
+                    agentType = MinimaxAgent(len(self.agents), verbose, depth = 3, hardCodedWeights = True,
+                                             collectStats = self.collectStats)
+                elif queryString[i] == "t":
+                    agentType = MinimaxAgent(len(self.agents), verbose, timeLimit = 1.0, collectStats = self.collectStats)
+                elif queryString[i] == "u":
+                    agentType = MCTSAgent(len(self.agents), verbose)
                 else:
                     print "\nDid not enter valid arguments! Invalid agent types"
                     print argumentsString
@@ -162,7 +211,7 @@ class Game:
                 self.agents.append(agentType)
         else: #Setup computer agents (default)
             for j in range(numComputerAgents):
-                computer = MinimaxAgent(len(self.agents), verbose)
+                computer = MinimaxAgent(len(self.agents), verbose, collectStats = self.collectStats)
                 print computer.index
                 self.agents.append(computer)
 
@@ -176,10 +225,13 @@ class Game:
         wins[-1] = 0 #Keep track of ties
 
         wins = {i:0 for i in range(numHumanAgents + numComputerAgents)}
+        totalSearchStats = {}
         for i in range(numberOfGames):
             print 'Game ' + str(i + 1)
             stats = self.runGames(gridSize, nInARow, numComputerAgents, numHumanAgents, verbose)
             wins[stats['winner']] += 1
+            for agent, searchStats in stats['searchStats'].items():
+                totalSearchStats.setdefault(agent, SearchStats(0)).add(searchStats)
 
         resultMessage = ''
         for index in wins:
@@ -190,9 +242,17 @@ class Game:
         print "Number of games: " + str(numberOfGames)
         print "Wins For Each Player: " + resultMessage
         print "Win percentage (player 0): " + str(float(wins[0]) / numberOfGames * 100) + '%'
+        for agent in sorted(totalSearchStats):
+            print "Search statistics (player " + str(agent) + "):"
+            print totalSearchStats[agent].summary()
 
 if __name__ == '__main__':
     args = sys.argv[1:] # Get game components based on input
-    game = Game()
-    game.repl(args)
+    options = parseOptions(args)
+    tracer = makeTracer(options.get('trace'), options.get('traceLevel', 'move'))
+    game = Game(options.get('record'), '--stats' in args, tracer)
+    game.repl([arg for arg in args if not arg.startswith('--')])
+    if game.recordWriter != None:
+        game.recordWriter.close()
+    tracer.close()
 
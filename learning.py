@@ -1,20 +1,104 @@
 import pickle
 import sys
+import os
+import random
+import tempfile
+import Queue
+import multiprocessing
 from util import *
 from agents import *
 from gameState import *
+from weightStore import WeightTable, writeWeights
+from gameRecord import GameRecordWriter, describeAgent
+from tdTrainer import TDTrainer, inverseSqrtSchedule, constantSchedule
+from batchSimulator import BatchSimulator
 from math import sqrt
 
+WIN_REWARD = 100000
+# Seconds the learner waits for a game before it checks that the workers are alive
+WORKER_POLL_SECONDS = 5
 
-def learnWeights(gridSize, nInARow, verboseFlag, numberOfGames, agents):
-
-    weightVector = None
+def loadWeightVector():
     try:
         with open( "weightVector4.p", "rb" ) as f:
             weightVector = pickle.load(f)
             f.close()
     except IOError:
         weightVector = {}
+    return weightVector
+
+def tdUpdate(weightVector, stateNewFeatures, reward, successorStateNewFeatures, ended, step, gamma = 1.0):
+    """
+    One TD(0) update of weightVector for a transition, given the features
+    (see GameState.getFeatures) of the state and its successor.
+    """
+    stateFeatureVector = {key:1 for key in stateNewFeatures}
+    successorStateFeatureVector = {key:1 for key in successorStateNewFeatures}
+
+    for key in stateFeatureVector.keys():
+        if not key in weightVector:
+            weightVector[key] = 0
+
+        if ended: #Do not calculate dot product if sPrime is an end state
+            weightVector[key] = weightVector[key] - step * (dotProduct(weightVector, stateFeatureVector) - reward) * stateFeatureVector[key]
+        else:
+            weightVector[key] = weightVector[key] - step * (dotProduct(weightVector, stateFeatureVector) - (reward + gamma * dotProduct(successorStateFeatureVector, weightVector))) * stateFeatureVector[key]
+
+def getReward(state, index):
+    if state.gameEnded():
+        if state.getWinner() == index:
+            return WIN_REWARD
+        else:
+            return - WIN_REWARD
+    return 0
+
+def makeTrainer(weightVector, lambda_, stepSchedule, batchSize):
+    """
+    Returns a TDTrainer for weightVector, or None to train with tdUpdate (when lambda_ is None).
+    """
+    if lambda_ == None:
+        return None
+    return TDTrainer(weightVector, lambda_, stepSchedule = stepSchedule, batchSize = batchSize)
+
+def transitionsFromGame(gridSize, nInARow, moves):
+    """
+    Replays a game of two players given as its list of moves (such as those of
+    batchSimulator.BatchSimulator) and returns its transitions as selfPlayWorker
+    makes them: a list of (index, state features, reward, successor features, ended),
+    two per move.
+    """
+    state = GameState(nInARow, gridSize, 2)
+    gameTransitions = []
+    for i, action in enumerate(moves):
+        stateFeatures = [state.getFeatures(index) for index in range(2)]
+        state.makeMove(i % 2, action)
+        for index in range(2):
+            gameTransitions.append((index, stateFeatures[index], getReward(state, index),
+                                    state.getFeatures(index), state.gameEnded()))
+    return gameTransitions
+
+def trainOnTransitions(weightVector, trainer, gameTransitions, step):
+    """
+    Applies the TD updates of the transitions of one game, with trainer or else with tdUpdate.
+    """
+    for index, stateFeatures, reward, successorFeatures, ended in gameTransitions:
+        if trainer != None:
+            trainer.update(stateFeatures, reward, successorFeatures, ended, index)
+        else:
+            tdUpdate(weightVector, stateFeatures, reward, successorFeatures, ended, step)
+    if trainer != None:
+        trainer.endGame()
+
+def learnWeights(gridSize, nInARow, verboseFlag, numberOfGames, agents, lambda_ = None, stepSchedule = None, batchSize = 1,
+                 recordPath = None):
+    """
+    Self-play training in this process. With lambda_ (and optionally stepSchedule
+    and batchSize) the weights are trained with tdTrainer.TDTrainer, else with tdUpdate.
+    With recordPath, every game is appended to that record file (see gameRecord.py).
+    """
+    weightVector = loadWeightVector()
+    trainer = makeTrainer(weightVector, lambda_, stepSchedule, batchSize)
+    recordWriter = GameRecordWriter(recordPath) if recordPath != None else None
 
     wins = [0, 0]
     step = 0.2
@@ -27,39 +111,29 @@ def learnWeights(gridSize, nInARow, verboseFlag, numberOfGames, agents):
         print gameNum
         state = GameState(nInARow, gridSize, 2)
         agentIndex = 0
+        moves = []
 
         while not state.gameEnded():
 
             def updateWeightVector(weightVector, sars, index):
-                gamma = 1.0
                 step = 0.2/sqrt(gameNum + 1)
                 (state, action, reward, successorState) = sars
 
                 stateNewFeatures = state.getFeatures(index)
                 successorStateNewFeatures = successorState.getFeatures(index)
-
-                stateFeatureVector = {key:1 for key in stateNewFeatures}
-                successorStateFeatureVector = {key:1 for key in successorStateNewFeatures}
                 if verboseFlag:
-                    print "StateFeatureVector: ", stateFeatureVector
-                    print "successorStateFeatureVector: ", successorStateFeatureVector
-
-                for key in stateFeatureVector.keys():
-                    if not key in weightVector:
-                        weightVector[key] = 0
-                    if not key in stateNewFeatures:
-                        stateFeatureVector[key] = 0
-                    if not key in successorStateNewFeatures:
-                        successorStateFeatureVector[key] = 0
-
-                    if successorState.gameEnded(): #Do not calculate dot product if sPrime is an end state
-                        weightVector[key] = weightVector[key] - step * (dotProduct(weightVector, stateFeatureVector) - reward) * stateFeatureVector[key]
-                    else:                    
-                        weightVector[key] = weightVector[key] - step * (dotProduct(weightVector, stateFeatureVector) - (reward + gamma * dotProduct(successorStateFeatureVector, weightVector))) * stateFeatureVector[key]
+                    print "StateFeatureVector: ", {key:1 for key in stateNewFeatures}
+                    print "successorStateFeatureVector: ", {key:1 for key in successorStateNewFeatures}
+
+                if trainer != None:
+                    trainer.update(stateNewFeatures, reward, successorStateNewFeatures, successorState.gameEnded(), index)
+                else:
+                    tdUpdate(weightVector, stateNewFeatures, reward, successorStateNewFeatures, successorState.gameEnded(), step)
 
             s = state
             agent = agents[agentIndex]
             action = agent.getAction(state)
+            moves.append(action)
 
             state = state.generateSuccessor(agentIndex, action)
             sPrime = state
@@ -67,18 +141,16 @@ def learnWeights(gridSize, nInARow, verboseFlag, numberOfGames, agents):
                 print sPrime
 
             for index in range(2):
-                reward = 0
-                if sPrime.gameEnded():
-                    if sPrime.getWinner() == index:
-                        reward = 100000
-                    else:
-                        reward = - 100000
-
+                reward = getReward(sPrime, index)
                 sars = (s, action, reward, sPrime)
                 updateWeightVector(weightVector, sars, index)
 
             agentIndex = (agentIndex + 1) % 2
 
+        if trainer != None:
+            trainer.endGame()
+        if recordWriter != None:
+            recordWriter.write(gridSize, nInARow, 2, [describeAgent(agent) for agent in agents], moves, state.winner)
         if verboseFlag:
             print 'Winner: ' + str(state.winner)
 
@@ -86,16 +158,189 @@ def learnWeights(gridSize, nInARow, verboseFlag, numberOfGames, agents):
             wins[state.winner] += 1
 
 
+    if trainer != None:
+        trainer.flush()
+    if recordWriter != None:
+        recordWriter.close()
     print "================= Final statistics ==================="
     print "Number of games: " + str(numberOfGames)
     print "Player 0: " + str(wins[0]) + ", Player 1: " + str(wins[1])
 
     pickle.dump(weightVector, open( "weightVector.p", "wb" ) )
 
+def selfPlayWorker(gridSize, nInARow, agentsQuery, gamesLeft, snapshotPath, snapshotVersion, transitions):
+    """
+    Plays games until gamesLeft runs out. Each game is put on transitions as
+    (winner, moves, list of (index, state features, reward, successor features, ended)),
+    with two transitions per move, one for each player index.
+    The agents' weights are reloaded from snapshotPath whenever the learner publishes a new snapshot.
+    """
+    random.seed() # forked workers would otherwise all play the same games
+    agents = makeAgents(agentsQuery, False)
+    version = 0
+    while True:
+        with gamesLeft.get_lock():
+            if gamesLeft.value == 0:
+                break
+            gamesLeft.value -= 1
+
+        if snapshotVersion.value != version:
+            version = snapshotVersion.value
+            weights = WeightTable(snapshotPath)
+            for agent in agents:
+                agent.updateWeights(weights)
+
+        state = GameState(nInARow, gridSize, 2)
+        agentIndex = 0
+        moves = []
+        gameTransitions = []
+        while not state.gameEnded():
+            action = agents[agentIndex].getAction(state)
+            moves.append(action)
+            stateFeatures = [state.getFeatures(index) for index in range(2)]
+            state.makeMove(agentIndex, action)
+            for index in range(2):
+                gameTransitions.append((index, stateFeatures[index], getReward(state, index),
+                                        state.getFeatures(index), state.gameEnded()))
+            agentIndex = (agentIndex + 1) % 2
+        transitions.put((state.winner, moves, gameTransitions))
+
+def learnWeightsParallel(gridSize, nInARow, verboseFlag, numberOfGames, agentsQuery, numWorkers, snapshotGames = 10,
+                         lambda_ = None, stepSchedule = None, batchSize = 1, recordPath = None):
+    """
+    learnWeights with the games played by numWorkers self-play processes.
+    This process is the learner: it applies the TD updates of every game it
+    receives, and every snapshotGames games publishes the weights to a
+    snapshot file of this run (see weightStore.py) for the workers to pick up.
+    Raises RuntimeError if a worker dies, or the workers stop before every
+    game has been received.
+    """
+    weightVector = loadWeightVector()
+    trainer = makeTrainer(weightVector, lambda_, stepSchedule, batchSize)
+    recordWriter = GameRecordWriter(recordPath) if recordPath != None else None
+    agentNames = [describeAgent(agent) for agent in makeAgents(agentsQuery, False)]
+    fd, snapshotPath = tempfile.mkstemp(prefix = 'weightSnapshot', suffix = '.w')
+    os.close(fd)
+    workers = []
+    try:
+        writeWeights(weightVector, snapshotPath)
+        snapshotVersion = multiprocessing.Value('i', 1)
+        gamesLeft = multiprocessing.Value('i', numberOfGames)
+        transitions = multiprocessing.Queue()
+        for _ in range(numWorkers):
+            worker = multiprocessing.Process(target = selfPlayWorker,
+                                             args = (gridSize, nInARow, agentsQuery, gamesLeft, snapshotPath,
+                                                     snapshotVersion, transitions))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        wins = [0, 0]
+        for gameNum in range(numberOfGames):
+            while True:
+                try:
+                    winner, moves, gameTransitions = transitions.get(timeout = WORKER_POLL_SECONDS)
+                    break
+                except Queue.Empty:
+                    # A worker that died took the game it was playing with it
+                    if any(worker.exitcode not in (None, 0) for worker in workers):
+                        raise RuntimeError('A self-play worker died, exit codes: ' +
+                                           str([worker.exitcode for worker in workers]))
+                    if not any(worker.is_alive() for worker in workers):
+                        raise RuntimeError('The self-play workers stopped after ' + str(gameNum) + ' of ' +
+                                           str(numberOfGames) + ' games')
+            if recordWriter != None:
+                recordWriter.write(gridSize, nInARow, 2, agentNames, moves, winner)
+            print gameNum
+            trainOnTransitions(weightVector, trainer, gameTransitions, 0.2/sqrt(gameNum + 1))
+
+            if verboseFlag:
+                print 'Winner: ' + str(winner)
+            if winner >= 0:
+                wins[winner] += 1
+
+            if (gameNum + 1) % snapshotGames == 0:
+                if trainer != None:
+                    trainer.flush()
+                writeWeights(weightVector, snapshotPath)
+                snapshotVersion.value += 1
+
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        os.remove(snapshotPath)
+
+    if trainer != None:
+        trainer.flush()
+    if recordWriter != None:
+        recordWriter.close()
+    print "================= Final statistics ==================="
+    print "Number of games: " + str(numberOfGames)
+    print "Player 0: " + str(wins[0]) + ", Player 1: " + str(wins[1])
+
+    pickle.dump(weightVector, open( "weightVector.p", "wb" ) )
+
+def learnWeightsFromRandomGames(gridSize, nInARow, verboseFlag, numberOfGames, simulatorBatch, lambda_ = None,
+                                stepSchedule = None, batchSize = 1, recordPath = None):
+    """
+    learnWeights on games between two random players, played simulatorBatch at a time
+    by a BatchSimulator instead of by agents.
+    """
+    weightVector = loadWeightVector()
+    trainer = makeTrainer(weightVector, lambda_, stepSchedule, batchSize)
+    recordWriter = GameRecordWriter(recordPath) if recordPath != None else None
+    simulator = BatchSimulator(gridSize, nInARow, simulatorBatch)
+
+    wins = [0, 0]
+    for gameNum, (winner, moves) in enumerate(simulator.run(numberOfGames)):
+        if recordWriter != None:
+            recordWriter.write(gridSize, nInARow, 2, ['RandomAgent', 'RandomAgent'], moves, winner)
+        if verboseFlag:
+            print str(gameNum) + ' Winner: ' + str(winner)
+        trainOnTransitions(weightVector, trainer, transitionsFromGame(gridSize, nInARow, moves), 0.2/sqrt(gameNum + 1))
+        if winner >= 0:
+            wins[winner] += 1
+
+    if trainer != None:
+        trainer.flush()
+    if recordWriter != None:
+        recordWriter.close()
+    print "================= Final statistics ==================="
+    print "Number of games: " + str(numberOfGames)
+    print "Player 0: " + str(wins[0]) + ", Player 1: " + str(wins[1])
+
+    pickle.dump(weightVector, open( "weightVector.p", "wb" ) )
+
+def makeAgents(agentsQuery, verbose):
+    agents = []
+    for i in range(2):
+        if agentsQuery[i] == 'r':
+            agents.append(RandomAgent(i, verbose))
+        elif agentsQuery[i] == 'm':
+            agents.append(MinimaxAgent(i, verbose))
+        else:
+            agents.append(MinimaxAgent(i, verbose, hardCodedWeights=True))
+    return agents
+
 
 if __name__ == '__main__':
-    args = sys.argv[1:]
-    if len(args) != 5:
+    # Arguments: gridSize nInARow verbose numberOfGames agents [numWorkers] [options]
+    # With numWorkers, games are played by that many self-play processes
+    # Options (train with tdTrainer.TDTrainer instead of tdUpdate):
+    #   --lambda=L          Eligibility trace decay
+    #   --step=S            Initial step size, S / sqrt(gameNum + 1) (default: 0.2)
+    #   --constantStep=S    Constant step size S
+    #   --batch=B           Apply the updates of B transitions at a time (default: 1)
+    # --record=file: Append every game played to file (see gameRecord.py)
+    # --simulate=K: With agents rr, play the games K at a time with batchSimulator.BatchSimulator
+    options = parseOptions(sys.argv[1:])
+    recordPath = options.pop('record', None)
+    simulatorBatch = options.pop('simulate', None)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) != 5 and len(args) != 6:
         print "Invalid arguments"
     else:
         gridSize = int(args[0])
@@ -103,13 +348,22 @@ if __name__ == '__main__':
         verbose = int(args[2])
         numberOfGames = int(args[3])
         agentsQuery = args[4]
-        agents = []
-        for i in range(2):
-            if agentsQuery[i] == 'r':
-                agents.append(RandomAgent(i, verbose))
-            elif agentsQuery[i] == 'm':
-                agents.append(MinimaxAgent(i, verbose))
+        lambda_ = float(options.get('lambda', 0)) if options else None
+        if 'constantStep' in options:
+            stepSchedule = constantSchedule(float(options['constantStep']))
+        else:
+            stepSchedule = inverseSqrtSchedule(float(options.get('step', 0.2)))
+        batchSize = int(options.get('batch', 1))
+        if simulatorBatch != None:
+            if agentsQuery != 'rr':
+                print "--simulate only plays random agents (rr)"
             else:
-                agents.append(MinimaxAgent(i, verbose, hardCodedWeights=True))
-
-        learnWeights(gridSize, nInARow, verbose, numberOfGames, agents)
+                learnWeightsFromRandomGames(gridSize, nInARow, verbose, numberOfGames, int(simulatorBatch),
+                                            lambda_ = lambda_, stepSchedule = stepSchedule, batchSize = batchSize,
+                                            recordPath = recordPath)
+        elif len(args) == 6:
+            learnWeightsParallel(gridSize, nInARow, verbose, numberOfGames, agentsQuery, int(args[5]),
+                                 lambda_ = lambda_, stepSchedule = stepSchedule, batchSize = batchSize, recordPath = recordPath)
+        else:
+            learnWeights(gridSize, nInARow, verbose, numberOfGames, makeAgents(agentsQuery, verbose),
+                         lambda_ = lambda_, stepSchedule = stepSchedule, batchSize = batchSize, recordPath = recordPath)
@@ -0,0 +1,251 @@
+"""
+Monte Carlo tree search (UCT) agent.
+
+Every iteration walks down the tree by the UCT rule, adds one child, plays a
+random game (a playout) from it and counts the result in every node on the
+way back up. Playouts are played on a copy of the bitboard, with moves drawn
+from the empty cells next to a stone, so they skip the feature bookkeeping
+of GameState. The tree is kept between moves: the subtree of the position
+after the opponents' replies becomes the new root.
+
+With a prior, the learned weights (see MinimaxAgent.evaluateActions) order
+the children of a node, and better ranked children get a bonus that fades as
+they are visited.
+"""
+
+import math
+import random
+import time
+from bitboard import BitBoard
+from gameState import GameState
+from threats import boardMask, nearbyCells
+from agents import Agent, MinimaxAgent
+
+def randomPlayout(board, player, N):
+    """
+    Plays random moves from board (player to move) until a player has N in a row
+    or the board is full. Every move is next to a stone. board is not changed.
+    Returns the winner, or -1 for a tie.
+    """
+    board = BitBoard(board.boardSize, board.numPlayers, board)
+    width = board.width
+    numPlayers = board.numPlayers
+    full = boardMask(board)
+    offsets = [1, -1, width, -width, width + 1, width - 1, -width + 1, -width - 1]
+    if board.numPieces == 0:
+        cells = [((board.boardSize + 1) / 2, (board.boardSize + 1) / 2)]
+    else:
+        cells = nearbyCells(board, 1)
+    cells = [y * width + x for x, y in cells]
+    listed = board.occupied # cells that are taken or already in cells
+    for cell in cells:
+        listed |= 1 << cell
+    while cells:
+        # Take a random cell out of the list in constant time
+        i = random.randrange(len(cells))
+        cell = cells[i]
+        cells[i] = cells[-1]
+        cells.pop()
+        move = (cell % width, cell // width)
+        board.place(player, move)
+        if board.isWin(player, move, N):
+            return player
+        for offset in offsets:
+            neighbour = cell + offset
+            if neighbour >= 0:
+                b = 1 << neighbour
+                if full & b and not listed & b:
+                    listed |= b
+                    cells.append(neighbour)
+        player = (player + 1) % numPlayers
+    return -1
+
+class MCTSNode():
+    """
+    Instance variables:
+        move:     The move that led to this node, made by player
+        children: A dictionary of (move => MCTSNode)
+        untried:  Moves without a child yet, the next one last (None until the node is expanded)
+        visits:   Playouts through this node
+        score:    Points of player in those playouts (1 win, 0.5 tie)
+        prior:    Bonus of the node's rank among its siblings (0 without a prior)
+    """
+    __slots__ = ('move', 'player', 'parent', 'children', 'untried', 'visits', 'score', 'prior')
+
+    def __init__(self, move, player, parent, prior = 0.0):
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = {}
+        self.untried = None
+        self.visits = 0
+        self.score = 0.0
+        self.prior = prior
+
+class MCTSAgent(Agent):
+    """
+    Chooses the move of the most visited child of the root after numPlayouts
+    playouts, or as many as fit in timeLimit seconds if it is set.
+
+    Parameters:
+        exploration: The UCT exploration constant
+        usePrior:    Order and bias the children with the learned weights in weightsFile
+    """
+
+    PRIOR_BIAS = 1.0 # weight of the prior of the best ranked child
+
+    def __init__(self, index, verbose, numPlayouts = 1000, timeLimit = None, exploration = 1.4, usePrior = False,
+                 weightsFile = 'weightVector4.p'):
+        self.index = index
+        self.verbose = verbose
+        self.numPlayouts = numPlayouts
+        self.timeLimit = timeLimit
+        self.exploration = exploration
+        self.priorAgent = None
+        if usePrior:
+            # Only evaluateActions is used: no transposition table or threat search
+            self.priorAgent = MinimaxAgent(index, False, ttMemoryMB = None, weightsFile = weightsFile,
+                                           threatSearch = False)
+        self.root = None # the root of the last search, kept for the next move
+        self.rootMasks = None # board.masks of the root's position
+        self.rootGame = None # (boardSize, N) of the root's position
+
+    def getAction(self, gameState):
+        state = GameState(gameState.N, gameState.boardSize, gameState.numPlayers, prevState = gameState)
+        root = self.reuseRoot(state)
+        if root == None:
+            root = MCTSNode(None, (state.currentPlayer - 1) % state.numPlayers, None)
+        reusedVisits = root.visits
+
+        startTime = time.time()
+        deadline = startTime + self.timeLimit if self.timeLimit != None else None
+        numPlayouts = 0
+        while (numPlayouts < self.numPlayouts) if deadline == None else (time.time() < deadline):
+            self.iterate(root, state)
+            numPlayouts += 1
+            if root.untried == [] and not root.children:
+                break # the game is over
+
+        self.root = root
+        self.rootMasks = list(state.board.masks)
+        self.rootGame = (state.boardSize, state.N)
+        best = max(root.children.itervalues(), key = lambda child: (child.visits, child.score))
+        if self.verbose:
+            print 'MCTS: ' + str(numPlayouts) + ' playouts (' + str(reusedVisits) + ' reused) in ' + \
+                ('%.3f' % (time.time() - startTime)) + 's, move ' + str(best.move) + ' won ' + \
+                ('%.3f' % (best.score / best.visits)) + ' of ' + str(best.visits)
+        return best.move
+
+    def reuseRoot(self, state):
+        """
+        Returns the node of state in the tree of the last search, as the root of
+        a new tree, or None if state was not reached from it (by at most one move per player).
+        """
+        root = self.root
+        self.root = None
+        if root == None or len(self.rootMasks) != state.numPlayers or self.rootGame != (state.boardSize, state.N):
+            return None
+        masks = state.board.masks
+        newStones = [mask & ~old for mask, old in zip(masks, self.rootMasks)]
+        if any(old & ~mask for mask, old in zip(masks, self.rootMasks)):
+            return None # a new game
+        numMoves = sum(bin(stones).count('1') for stones in newStones)
+        if numMoves > state.numPlayers:
+            return None
+        node = root
+        width = state.board.width
+        for k in range(numMoves):
+            player = (node.player + 1) % state.numPlayers
+            stone = newStones[player]
+            if stone == 0 or stone & (stone - 1):
+                return None # not one stone per player in turn
+            cell = stone.bit_length() - 1
+            node = node.children.get((cell % width, cell // width))
+            if node == None:
+                return None
+        if (node.player + 1) % state.numPlayers != state.currentPlayer:
+            return None
+        node.parent = None
+        node.move = None
+        return node
+
+    def iterate(self, root, state):
+        """
+        One iteration: selection, expansion, playout and backpropagation.
+        state is the root's position and is left as it was.
+        """
+        node = root
+        numMade = 0
+        # Selection
+        while node.untried == [] and node.children:
+            node = self.selectChild(node)
+            state.makeMove(node.player, node.move)
+            numMade += 1
+        # Expansion
+        if node.untried == None:
+            node.untried = self.orderMoves(state) if not state.gameEnded() else []
+        if node.untried:
+            prior = node.untried[-1][1]
+            move = node.untried.pop()[0]
+            player = state.currentPlayer
+            child = MCTSNode(move, player, node, prior)
+            node.children[move] = child
+            state.makeMove(player, move)
+            numMade += 1
+            node = child
+        # Playout
+        if state.gameEnded():
+            winner = state.getWinner()
+        else:
+            winner = randomPlayout(state.board, state.currentPlayer, state.N)
+        # Backpropagation
+        while node != None:
+            node.visits += 1
+            if winner == node.player:
+                node.score += 1
+            elif winner == -1:
+                node.score += 0.5
+            node = node.parent
+        for _ in range(numMade):
+            state.undoMove()
+
+    def selectChild(self, node):
+        logVisits = math.log(node.visits)
+        exploration = self.exploration
+        bias = self.PRIOR_BIAS
+        best = None
+        bestValue = None
+        for child in node.children.itervalues():
+            value = child.score / child.visits + exploration * math.sqrt(logVisits / child.visits) + \
+                bias * child.prior / (child.visits + 1)
+            if bestValue == None or value > bestValue:
+                best = child
+                bestValue = value
+        return best
+
+    def orderMoves(self, state):
+        """
+        Returns a list of (move, prior) of the moves of the player to move in state,
+        in the order they are expanded, the first one last.
+        """
+        legalMoves = state.getLegalActions()
+        if self.priorAgent == None:
+            random.shuffle(legalMoves)
+            return [(move, 0.0) for move in legalMoves]
+
+        player = state.currentPlayer
+        sign = 1 if player == self.index else -1
+        ranked = []
+        for score, action, winner in self.priorAgent.evaluateActions(state, legalMoves, player):
+            if score == None:
+                # A move that ends the game: a win comes first, a tie after every other move
+                score = float('inf') if winner == player else float('-inf')
+            else:
+                score *= sign
+            ranked.append((score, action))
+        ranked.sort(key = lambda x: -x[0])
+        return [(action, 1.0 / (rank + 1)) for rank, (_, action) in reversed(list(enumerate(ranked)))]
+
+    def updateWeights(self, weights):
+        if self.priorAgent != None:
+            self.priorAgent.updateWeights(weights)
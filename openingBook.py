@@ -0,0 +1,171 @@
+"""
+Opening books: statistics of the moves played in early positions, looked up by Zobrist hash.
+
+Positions are stored in their canonical form (see GameState.getCanonicalHash), with moves
+in the canonical frame, so the 8 symmetries of a position share their statistics.
+
+A book file is a header followed by one entry per (position, move), sorted by
+position hash, so the moves of a position are found with a binary search of the
+memory-mapped file:
+    header:  magic 'GMKB', format version, boardSize, N, maxPly, number of entries
+    entry:   position hash, move x, move y, games, points (in half points, a tie is 1)
+Points are those of the player who made the move, and the hash includes the player to move.
+
+Build a book from game records (see gameRecord.py) with
+    python openingBook.py book.bin boardSize N records... [--maxPly=P] [--minSamples=S]
+Results of offline searches can be added with BookBuilder.addMove.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from gameState import GameState
+from util import writeAtomically, parseOptions
+from gameRecord import readGameRecords
+from symmetry import transformMove, inverseTransformMove
+
+MAGIC = 'GMKB'
+VERSION = 2
+HEADER = struct.Struct('<4sIBBBxI')
+ENTRY = struct.Struct('<QBBII')
+
+class BookBuilder():
+    """
+    Collects the statistics of a book in memory.
+
+    Instance variables:
+        stats:  A dictionary of ((hash, move) => [games, half points])
+        maxPly: Only positions with fewer than maxPly stones are kept
+    """
+
+    def __init__(self, boardSize, N, maxPly = 8):
+        self.boardSize = boardSize
+        self.N = N
+        self.maxPly = maxPly
+        self.stats = {}
+
+    def addMove(self, hash, move, halfPoints, games = 1):
+        """
+        Count games in which move was played at the position with canonical hash,
+        and won halfPoints half points for the player who made it. move is in the canonical frame.
+        """
+        entry = self.stats.get((hash, move))
+        if entry == None:
+            self.stats[(hash, move)] = [games, halfPoints]
+        else:
+            entry[0] += games
+            entry[1] += halfPoints
+
+    def addGame(self, record):
+        """
+        Add the first maxPly moves of a GameRecord. Returns False if the record
+        is of another board or is not a two player game.
+        """
+        if record.boardSize != self.boardSize or record.N != self.N or record.numPlayers != 2:
+            return False
+        state = GameState(self.N, self.boardSize, 2)
+        for player, move in record.playerMoves()[:self.maxPly]:
+            if record.winner == -1:
+                halfPoints = 1
+            else:
+                halfPoints = 2 if record.winner == player else 0
+            hash, transform = state.getCanonicalHash()
+            self.addMove(hash, transformMove(transform, move, self.boardSize), halfPoints)
+            if not state.makeMove(player, move):
+                break
+        return True
+
+    def write(self, path, minSamples = 1):
+        """
+        Write the moves played at least minSamples times to a book file.
+        """
+        entries = sorted((hash, move, games, halfPoints) for (hash, move), (games, halfPoints)
+                         in self.stats.iteritems() if games >= minSamples)
+        writeAtomically(path, HEADER.pack(MAGIC, VERSION, self.boardSize, self.N, self.maxPly, len(entries)) +
+                        ''.join(ENTRY.pack(hash, move[0], move[1], games, halfPoints)
+                                for hash, move, games, halfPoints in entries))
+        return len(entries)
+
+class OpeningBook():
+    """
+    A read-only, memory-mapped book file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, self.boardSize, self.N, self.maxPly, self.numEntries = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            raise IOError('Not an opening book (version ' + str(VERSION) + '): ' + path)
+
+    def entryHash(self, i):
+        return struct.unpack_from('<Q', self.mapping, HEADER.size + i * ENTRY.size)[0]
+
+    def lookup(self, hash):
+        """
+        Returns a list of (move, games, score) for the position with canonical hash,
+        with moves in the canonical frame, where score is the average points of the move (1 win, 0.5 tie, 0 loss).
+        """
+        # Binary search for the first entry of hash
+        low = 0
+        high = self.numEntries
+        while low < high:
+            middle = (low + high) // 2
+            if self.entryHash(middle) < hash:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        i = low
+        while i < self.numEntries:
+            entryHash, x, y, games, halfPoints = ENTRY.unpack_from(self.mapping, HEADER.size + i * ENTRY.size)
+            if entryHash != hash:
+                break
+            moves.append(((x, y), games, halfPoints / (2.0 * games)))
+            i += 1
+        return moves
+
+    def bestMove(self, state, minSamples = 1):
+        """
+        Returns the legal book move with the best score in state played at least
+        minSamples times, or None if there is none (or state is past the book).
+        """
+        if state.boardSize != self.boardSize or state.N != self.N or len(state.board) >= self.maxPly:
+            return None
+        best = None
+        legalActions = set(state.getLegalActions())
+        hash, transform = state.getCanonicalHash()
+        for move, games, score in self.lookup(hash):
+            move = inverseTransformMove(transform, move, self.boardSize)
+            if games >= minSamples and move in legalActions:
+                if best == None or (score, games) > best[1:]:
+                    best = (move, score, games)
+        return best[0] if best != None else None
+
+_books = {}
+
+def loadBook(path):
+    """
+    Returns the OpeningBook at path, opened at most once per process.
+    """
+    path = os.path.abspath(path)
+    if not path in _books:
+        _books[path] = OpeningBook(path)
+    return _books[path]
+
+if __name__ == '__main__':
+    options = parseOptions(sys.argv[1:])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 4:
+        print "Usage: python openingBook.py book.bin boardSize N records... [--maxPly=P] [--minSamples=S]"
+    else:
+        builder = BookBuilder(int(args[1]), int(args[2]), int(options.get('maxPly', 8)))
+        numGames = 0
+        for recordPath in args[3:]:
+            for record in readGameRecords(recordPath):
+                if builder.addGame(record):
+                    numGames += 1
+        numEntries = builder.write(args[0], int(options.get('minSamples', 1)))
+        print "Wrote " + str(numEntries) + " book moves from " + str(numGames) + " games to " + args[0]
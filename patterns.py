@@ -0,0 +1,214 @@
+import os
+import glob
+import pickle
+import hashlib
+import bitboard
+from bitboard import BitBoard
+from util import writeAtomically
+
+# Shapes a move can make on one line, weakest first
+NONE = 0
+THREE = 1       # one move away from a four
+OPEN_THREE = 2  # one move away from an open four (includes split threes such as X_XX)
+FOUR = 3        # one move away from N in a row
+OPEN_FOUR = 4   # two different moves make N in a row
+FIVE = 5        # N in a row
+SHAPE_NAMES = ['none', 'three', 'open three', 'four', 'open four', 'five']
+
+# Digits of a line window, seen from one player
+EMPTY = 0
+OWN = 1
+BLOCKED = 2 # a stone of another player, or off the board
+
+PATTERN_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.patternCache')
+PATTERN_CACHE_VERSION = 1
+
+def sourceHash():
+    """
+    Returns a short hash of the code the tables are built from (this module and
+    bitboard.py), or 'nosource' if it cannot be read. Cached tables are only
+    used if it matches, so changing the pattern definitions rebuilds them.
+    """
+    digest = hashlib.md5()
+    try:
+        for module in [__file__, bitboard.__file__]:
+            with open(os.path.splitext(module)[0] + '.py', 'rb') as f:
+                digest.update(f.read())
+    except IOError:
+        return 'nosource'
+    return digest.hexdigest()[:12]
+
+class PatternTables():
+    """
+    Lookup tables for the lines of a boardSize x boardSize board with N in a row.
+
+    Each line (row, column or diagonal) is encoded, for each player, as a base 3
+    integer with one digit per cell: EMPTY, OWN or BLOCKED. Lines are padded with
+    PAD BLOCKED digits on both ends, so a window around any cell never runs off the line.
+
+    Instance variables:
+        lines:          lines[lineIndex] is the list of (x, y) along the line
+        cellLines:      cellLines[y * boardSize + x] is the list of (lineIndex, position)
+                        of the 4 lines through (x, y), one per BitBoard.DIRECTIONS.
+                        position is the padded digit index of the cell.
+        emptyLineCodes: The code of every line on an empty board
+        powers:         powers[i] = 3 ** i
+        runForward:     Code of the N + 1 digits after a cell (nearest digit least significant)
+                        => (num, blocked) of the OWN run starting next to the cell
+        runBackward:    The same for the N + 1 digits before a cell (nearest digit most significant)
+        shapes:         A dictionary of (code of the N - 1 digits on each side of an empty cell
+                        (low digits before, high digits after) => shape made by playing there),
+                        filled by shape as windows are met: all 3 ** (2N - 2) of them would
+                        take minutes to build for N = 8
+    """
+
+    def __init__(self, boardSize, N):
+        self.boardSize = boardSize
+        self.N = N
+        self.PAD = N + 1
+        self.buildLines()
+        self.powers = [3 ** i for i in range(boardSize + 2 * self.PAD + 1)]
+        self.emptyLineCodes = []
+        for line in self.lines:
+            code = 0
+            for i in range(self.PAD):
+                code += BLOCKED * self.powers[i]
+                code += BLOCKED * self.powers[self.PAD + len(line) + i]
+            self.emptyLineCodes.append(code)
+        self.runForward = [self.classifyRun(self.digits(code, N + 1)) for code in range(3 ** (N + 1))]
+        self.runBackward = [self.classifyRun(self.digits(code, N + 1)[::-1]) for code in range(3 ** (N + 1))]
+        self.shapes = {}
+
+    def shape(self, code):
+        """
+        The shape made by playing in the middle of the window code (see shapes).
+        """
+        shape = self.shapes.get(code)
+        if shape == None:
+            N = self.N
+            window = self.digits(code, 2 * (N - 1))
+            shape = self.shapes[code] = classifyShape(window[:N - 1] + [OWN] + window[N - 1:], N)
+        return shape
+
+    def buildLines(self):
+        size = self.boardSize
+        self.lines = []
+        self.cellLines = [[] for _ in range(size * size)]
+        for dx, dy in BitBoard.DIRECTIONS:
+            for x in range(size):
+                for y in range(size):
+                    # Lines start at cells with no predecessor in this direction
+                    if 0 <= x - dx < size and 0 <= y - dy < size:
+                        continue
+                    line = []
+                    i, j = x, y
+                    while 0 <= i < size and 0 <= j < size:
+                        self.cellLines[j * size + i].append((len(self.lines), self.PAD + len(line)))
+                        line.append((i, j))
+                        i += dx
+                        j += dy
+                    self.lines.append(line)
+
+    def digits(self, code, length):
+        """
+        Returns the digits of code, least significant first.
+        """
+        result = []
+        for _ in range(length):
+            result.append(code % 3)
+            code /= 3
+        return result
+
+    def classifyRun(self, digits):
+        """
+        digits start next to a cell. Returns (num, blocked) of the OWN run they start with.
+        """
+        num = 0
+        while num < len(digits) and digits[num] == OWN:
+            num += 1
+        if num == len(digits):
+            return (num, 0)
+        return (num, 1 if digits[num] == BLOCKED else 0)
+
+def runThrough(window, center):
+    """
+    Length of the OWN run through window[center].
+    """
+    start = center
+    while start > 0 and window[start - 1] == OWN:
+        start -= 1
+    end = center
+    while end < len(window) - 1 and window[end + 1] == OWN:
+        end += 1
+    return end - start + 1
+
+def fiveCells(window, center, N):
+    """
+    The EMPTY cells of window that would make N in a row through window[center].
+    """
+    cells = []
+    for i in range(len(window)):
+        if window[i] == EMPTY:
+            window[i] = OWN
+            if runThrough(window, center) >= N:
+                cells.append(i)
+            window[i] = EMPTY
+    return cells
+
+def classifyShape(window, N):
+    """
+    window is the 2N - 1 digits around a stone that was just placed in the center.
+    Returns the shape the stone makes on this line.
+    """
+    center = N - 1
+    if runThrough(window, center) >= N:
+        return FIVE
+    numFiveCells = len(fiveCells(window, center, N))
+    if numFiveCells >= 2:
+        return OPEN_FOUR
+    if numFiveCells == 1:
+        return FOUR
+    shape = NONE
+    for i in range(len(window)):
+        if window[i] == EMPTY:
+            window[i] = OWN
+            numFiveCells = len(fiveCells(window, center, N))
+            window[i] = EMPTY
+            if numFiveCells >= 2:
+                return OPEN_THREE
+            if numFiveCells == 1:
+                shape = THREE
+    return shape
+
+_tables = {}
+
+def getPatternTables(boardSize, N):
+    """
+    Returns the PatternTables for a board. They are built once and cached
+    in memory and in PATTERN_CACHE_DIR, under the sourceHash of the code.
+    """
+    key = (boardSize, N)
+    if key in _tables:
+        return _tables[key]
+
+    prefix = os.path.join(PATTERN_CACHE_DIR, 'patterns_v%d_%d_%d_' % (PATTERN_CACHE_VERSION, boardSize, N))
+    path = prefix + sourceHash() + '.p'
+    tables = None
+    try:
+        with open(path, 'rb') as f:
+            tables = pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        tables = PatternTables(boardSize, N)
+        try:
+            if not os.path.isdir(PATTERN_CACHE_DIR):
+                os.makedirs(PATTERN_CACHE_DIR)
+            writeAtomically(path, pickle.dumps(tables, pickle.HIGHEST_PROTOCOL))
+            # Tables of older code are never read again
+            for stale in glob.glob(prefix + '*.p'):
+                if stale != path:
+                    os.remove(stale)
+        except (IOError, OSError):
+            pass # The cache is only an optimization
+
+    _tables[key] = tables
+    return tables
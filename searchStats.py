@@ -0,0 +1,109 @@
+"""
+Counters of what a MinimaxAgent search did, to see where the time of a move goes.
+
+An agent made with collectStats = True keeps a SearchStats of its last move
+in agent.lastSearchStats. Without it no counting is done at all.
+"""
+
+class SearchStats():
+    """
+    Instance variables:
+        numSearches:   Moves these statistics are of (1 for a single move, more once added up)
+        time:          Seconds spent in getAction
+        nodes:         Positions visited by the alpha-beta search
+        leaves:        Positions scored with the evaluation function at the search horizon
+        orderings:     Children scored by selectActions to order and prune the moves
+        cutoffs:       cutoffs[i] is the number of beta cutoffs caused by the i-th move searched
+        ttCutoffs:     Positions answered by the transposition table without a search
+        forcedBlocks:  Positions ordered by selectActions where the previous move made an
+                       open or blocked N - 1 run, the case its (unreached) forced block is for
+        depths:        A dictionary of (depth => [searches finished, seconds, nodes]) of
+                       every iteration (or the one fixed depth search)
+        sources:       A dictionary of (how the move was chosen => moves): 'search', 'book',
+                       'solver' or 'threat'
+    """
+
+    def __init__(self, numSearches = 1):
+        self.numSearches = numSearches
+        self.time = 0.0
+        self.nodes = 0
+        self.leaves = 0
+        self.orderings = 0
+        self.cutoffs = []
+        self.ttCutoffs = 0
+        self.forcedBlocks = 0
+        self.depths = {}
+        self.sources = {}
+
+    def addCutoff(self, moveIndex):
+        while len(self.cutoffs) <= moveIndex:
+            self.cutoffs.append(0)
+        self.cutoffs[moveIndex] += 1
+
+    def addDepth(self, depth, seconds, nodes):
+        entry = self.depths.setdefault(depth, [0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += nodes
+
+    def add(self, other):
+        """
+        Add the counts of other (another SearchStats) to these.
+        """
+        self.numSearches += other.numSearches
+        self.time += other.time
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.orderings += other.orderings
+        for moveIndex, count in enumerate(other.cutoffs):
+            while len(self.cutoffs) <= moveIndex:
+                self.cutoffs.append(0)
+            self.cutoffs[moveIndex] += count
+        self.ttCutoffs += other.ttCutoffs
+        self.forcedBlocks += other.forcedBlocks
+        for depth, (searches, seconds, nodes) in other.depths.items():
+            entry = self.depths.setdefault(depth, [0, 0.0, 0])
+            entry[0] += searches
+            entry[1] += seconds
+            entry[2] += nodes
+        for source, count in other.sources.items():
+            self.sources[source] = self.sources.get(source, 0) + count
+
+    def effectiveBranchingFactor(self):
+        """
+        The growth of the nodes per search from one depth to the next (of the two deepest
+        depths searched), or the depth-th root of the nodes with a single depth.
+        Returns None if nothing was searched.
+        """
+        depths = sorted(depth for depth in self.depths if self.depths[depth][2] > 0)
+        if len(depths) == 0:
+            return None
+        last = self.depths[depths[-1]]
+        if len(depths) == 1:
+            return (float(last[2]) / last[0]) ** (1.0 / depths[-1])
+        previous = self.depths[depths[-2]]
+        return (float(last[2]) / last[0]) / (float(previous[2]) / previous[0])
+
+    def summary(self):
+        """
+        Returns the statistics as lines of text.
+        """
+        lines = []
+        lines.append('Moves: ' + str(self.numSearches) + ', time: ' + ('%.3f' % self.time) + 's (' +
+                     ('%.4f' % (self.time / max(self.numSearches, 1))) + 's per move), chosen by: ' +
+                     ', '.join(source + ' ' + str(count) for source, count in sorted(self.sources.items())))
+        lines.append('Nodes: ' + str(self.nodes) + ', leaves: ' + str(self.leaves) + ', ordering evaluations: ' +
+                     str(self.orderings) + ', transposition table cutoffs: ' + str(self.ttCutoffs) +
+                     ', forced blocks: ' + str(self.forcedBlocks))
+        branchingFactor = self.effectiveBranchingFactor()
+        lines.append('Effective branching factor: ' + ('%.2f' % branchingFactor if branchingFactor != None else '-'))
+        totalCutoffs = sum(self.cutoffs)
+        if totalCutoffs > 0:
+            lines.append('Beta cutoffs: ' + str(totalCutoffs) + ', by move index: ' +
+                         ', '.join(str(i) + ': ' + ('%.1f' % (100.0 * count / totalCutoffs)) + '%'
+                                   for i, count in enumerate(self.cutoffs) if count > 0))
+        for depth in sorted(self.depths):
+            searches, seconds, nodes = self.depths[depth]
+            lines.append('Depth ' + str(depth) + ': ' + str(searches) + ' searches, ' +
+                         ('%.4f' % (seconds / searches)) + 's and ' + str(nodes / searches) + ' nodes per search')
+        return '\n'.join(lines)
@@ -0,0 +1,361 @@
+"""
+Exact solving of small games with depth-first proof-number search (df-pn).
+
+A position is solved as WIN, DRAW or LOSS for the player to move by two proof
+searches: can the player to move force N in a row, and if not, can the
+opponent. Both search every empty cell, not only GameState.getLegalActions,
+so the results are exact for the game. Positions are identified by their
+canonical hash (see GameState.getCanonicalHash), so symmetric positions share
+their proofs.
+
+The proof tables are bounded: when one holds more than maxEntries unresolved
+positions, those are dropped (proved and disproved positions are kept). With a
+cachePath, proved and disproved positions are saved to disk after every solve
+that resolves new positions, and loaded again by the next solver, so an
+interrupted solve resumes from its proofs.
+"""
+
+import os
+import struct
+import sys
+import time
+from gameState import GameState
+from bitboard import BitBoard
+from util import writeAtomically, parseOptions
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+RESULT_NAMES = {WIN: 'win', DRAW: 'draw', LOSS: 'loss'}
+
+INFINITY = 10 ** 9
+
+MAGIC = 'GMKP'
+VERSION = 1
+HEADER = struct.Struct('<4sIBBxxI')
+ENTRY = struct.Struct('<QBB') # canonical hash, attacker, proved (1) or disproved (0)
+
+class BudgetExceeded(Exception):
+    pass
+
+class SolverPosition():
+    """
+    Only what the solver needs of a GameState: the stones, the player to move
+    and the hashes of the 8 symmetries, so a move is a few bit operations.
+    """
+
+    def __init__(self, state):
+        self.board = BitBoard(state.boardSize, 2, state.board)
+        self.boardSize = state.boardSize
+        self.mover = state.currentPlayer
+        self.hashes = list(state.symmetryHashes)
+        self.keys = state.zobristKeys
+        self.turnKeys = self.keys.turns[0] ^ self.keys.turns[1]
+        self.moves = []
+
+    def emptyCells(self):
+        occupied = self.board.occupied
+        width = self.board.width
+        size = self.boardSize
+        return [(x, y) for y in range(size) for x in range(size) if not occupied & (1 << (y * width + x))]
+
+    def childHash(self, move):
+        """
+        The canonical hash after the player to move plays move.
+        """
+        keys = self.keys.symmetricPieces[self.mover][move[1] * self.boardSize + move[0]]
+        turnKeys = self.turnKeys
+        return min(h ^ key ^ turnKeys for h, key in zip(self.hashes, keys))
+
+    def play(self, move):
+        keys = self.keys.symmetricPieces[self.mover][move[1] * self.boardSize + move[0]]
+        self.hashes = [h ^ key ^ self.turnKeys for h, key in zip(self.hashes, keys)]
+        self.board.place(self.mover, move)
+        self.moves.append(move)
+        self.mover = 1 - self.mover
+
+    def undo(self):
+        move = self.moves.pop()
+        self.mover = 1 - self.mover
+        self.board.remove(self.mover, move)
+        keys = self.keys.symmetricPieces[self.mover][move[1] * self.boardSize + move[0]]
+        self.hashes = [h ^ key ^ self.turnKeys for h, key in zip(self.hashes, keys)]
+
+class ProofNumberSolver():
+    """
+    Solves two player positions of one boardSize and N.
+
+    Parameters:
+        maxEntries: Unresolved positions kept per proof table
+        cachePath:  File the proved and disproved positions are kept in between runs
+
+    Instance variables:
+        tables:   tables[attacker] is a dictionary of (canonical hash => (proof number, disproof number))
+                  for the proof that attacker wins. A proof number of 0 is proved, INFINITY disproved.
+        numNodes: Positions expanded by the last solve
+    """
+
+    def __init__(self, boardSize, N, maxEntries = 1000000, cachePath = None):
+        self.boardSize = boardSize
+        self.N = N
+        self.maxEntries = maxEntries
+        self.cachePath = cachePath
+        self.tables = [{}, {}]
+        self.numNodes = 0
+        self.maxNodes = None
+        self.deadline = None
+        self.numUnsaved = 0 # positions proved or disproved since the last save
+        if cachePath != None and os.path.exists(cachePath):
+            self.load()
+
+    def lookup(self, state):
+        """
+        Returns the result of state for the player to move if it is already known
+        exactly (without searching), else None.
+        """
+        if state.gameEnded():
+            return None
+        hash = state.getCanonicalHash()[0]
+        mover = state.currentPlayer
+        entry = self.tables[mover].get(hash)
+        if entry != None and entry[0] == 0:
+            return WIN
+        entry = self.tables[1 - mover].get(hash)
+        if entry != None and entry[0] == 0:
+            return LOSS
+        if entry != None and entry[1] == 0:
+            moverEntry = self.tables[mover].get(hash)
+            if moverEntry != None and moverEntry[1] == 0:
+                return DRAW
+        return None
+
+    def solve(self, state, maxNodes = None, deadline = None):
+        """
+        Returns WIN, DRAW or LOSS for the player to move in state, or None if
+        that takes more than maxNodes expansions or lasts past deadline (a time.time()).
+        state is not changed.
+        """
+        result = self.solveRoot(state, maxNodes, deadline)
+        self.saveChanges()
+        return result
+
+    def solveRoot(self, state, maxNodes, deadline):
+        """
+        solve, without saving the new proofs.
+        """
+        if state.numPlayers != 2 or state.boardSize != self.boardSize or state.N != self.N:
+            raise ValueError('The solver is for two player games of ' + str(self.boardSize) + 'x' +
+                             str(self.boardSize) + ', N = ' + str(self.N))
+        result = self.lookup(state)
+        if result != None:
+            return result
+        self.numNodes = 0
+        self.maxNodes = maxNodes
+        self.deadline = deadline
+        mover = state.currentPlayer
+        try:
+            if self.prove(state, mover):
+                return WIN
+            elif self.prove(state, 1 - mover):
+                return LOSS
+            else:
+                return DRAW
+        except BudgetExceeded:
+            return None
+
+    def bestMove(self, state, maxNodes = None, deadline = None):
+        """
+        Returns (move, result for the player to move) of the best move in state, or None
+        if the position could not be solved within maxNodes expansions and by deadline.
+        The move is read from the proof tables, without solving the children again.
+        """
+        result = self.solveRoot(state, maxNodes, deadline)
+        self.saveChanges()
+        if result == None:
+            return None
+        position = SolverPosition(state)
+        mover = position.mover
+        board = position.board
+        isLastMove = board.numPieces + 1 == self.boardSize * self.boardSize
+        bestMove = None
+        bestResult = None
+        for move in position.emptyCells():
+            board.place(mover, move)
+            wins = board.isWin(mover, move, self.N)
+            board.remove(mover, move)
+            if wins:
+                childResult = WIN
+            elif isLastMove:
+                childResult = DRAW
+            else:
+                childResult = self.childResult(position.childHash(move), mover)
+            if childResult != None and (bestResult == None or childResult > bestResult):
+                bestMove = move
+                bestResult = childResult
+                if bestResult == result:
+                    break
+        if bestMove == None:
+            return None
+        return (bestMove, bestResult)
+
+    def childResult(self, hash, mover):
+        """
+        The result for mover of the position with canonical hash hash (the opponent
+        to move) if the proof tables know it, else None.
+        """
+        if self.tables[mover].get(hash, (1, 1))[0] == 0:
+            return WIN
+        opponentEntry = self.tables[1 - mover].get(hash, (1, 1))
+        if opponentEntry[0] == 0:
+            return LOSS
+        if opponentEntry[1] == 0 and self.tables[mover].get(hash, (1, 1))[1] == 0:
+            return DRAW
+        return None
+
+    def prove(self, state, attacker):
+        """
+        Returns True if attacker can force a win from state, False if not.
+        """
+        position = SolverPosition(state)
+        table = self.tables[attacker]
+        hash = min(position.hashes)
+        while True:
+            proof, disproof = table.get(hash, (1, 1))
+            if proof == 0:
+                return True
+            if disproof == 0:
+                return False
+            self.search(position, attacker, INFINITY - 1, INFINITY - 1)
+
+    def children(self, position, attacker):
+        """
+        Returns a list of (move, canonical hash, proof number, disproof number) of the
+        positions after every move of the player to move, each position once.
+        A finished game has no hash, and is a proof (the attacker won) or a disproof.
+        """
+        table = self.tables[attacker]
+        mover = position.mover
+        board = position.board
+        isLastMove = board.numPieces + 1 == self.boardSize * self.boardSize
+        children = []
+        seen = set()
+        for move in position.emptyCells():
+            board.place(mover, move)
+            wins = board.isWin(mover, move, self.N)
+            board.remove(mover, move)
+            if wins:
+                children.append((move, None, 0, INFINITY) if mover == attacker else (move, None, INFINITY, 0))
+            elif isLastMove:
+                children.append((move, None, INFINITY, 0))
+            else:
+                hash = position.childHash(move)
+                # Symmetric moves lead to the same position, count it once
+                if hash in seen:
+                    continue
+                seen.add(hash)
+                numbers = table.get(hash, (1, 1))
+                children.append((move, hash, numbers[0], numbers[1]))
+        return children
+
+    def search(self, position, attacker, proofThreshold, disproofThreshold):
+        """
+        The df-pn multiple iterative deepening: expands position until its proof number
+        reaches proofThreshold or its disproof number disproofThreshold.
+        """
+        self.numNodes += 1
+        if self.maxNodes != None and self.numNodes > self.maxNodes:
+            raise BudgetExceeded()
+        if self.deadline != None and time.time() > self.deadline:
+            raise BudgetExceeded()
+        table = self.tables[attacker]
+        hash = min(position.hashes)
+        isOr = position.mover == attacker
+        index = 2 if isOr else 3
+        while True:
+            children = self.children(position, attacker)
+            if isOr:
+                proof = min(child[2] for child in children)
+                disproof = min(INFINITY, sum(child[3] for child in children))
+            else:
+                proof = min(INFINITY, sum(child[2] for child in children))
+                disproof = min(child[3] for child in children)
+            if proof >= proofThreshold or disproof >= disproofThreshold or proof == 0 or disproof == 0:
+                break
+
+            # The most proving child, and the second best number for its threshold
+            children.sort(key = lambda child: child[index])
+            best = children[0]
+            second = children[1][index] if len(children) > 1 else INFINITY
+            if isOr:
+                childProof = min(proofThreshold, second + 1)
+                childDisproof = disproofThreshold - disproof + best[3]
+            else:
+                childProof = proofThreshold - proof + best[2]
+                childDisproof = min(disproofThreshold, second + 1)
+            position.play(best[0])
+            self.search(position, attacker, min(childProof, INFINITY - 1), min(childDisproof, INFINITY - 1))
+            position.undo()
+
+        self.store(table, hash, proof, disproof)
+
+    def store(self, table, hash, proof, disproof):
+        if len(table) >= self.maxEntries and proof != 0 and disproof != 0:
+            # Keep the proofs, drop the unresolved positions
+            for key in [key for key, (p, d) in table.iteritems() if p != 0 and d != 0]:
+                del table[key]
+        if proof == 0 or disproof == 0:
+            self.numUnsaved += 1
+        table[hash] = (proof, disproof)
+
+    def saveChanges(self):
+        """
+        Save the tables to cachePath, if there is one and anything was resolved since the last save.
+        """
+        if self.cachePath != None and self.numUnsaved > 0:
+            self.save()
+
+    def save(self):
+        """
+        Write the proved and disproved positions to cachePath.
+        """
+        entries = []
+        for attacker in range(2):
+            for hash, (proof, disproof) in self.tables[attacker].iteritems():
+                if proof == 0 or disproof == 0:
+                    entries.append(ENTRY.pack(hash, attacker, 1 if proof == 0 else 0))
+        writeAtomically(self.cachePath, HEADER.pack(MAGIC, VERSION, self.boardSize, self.N, len(entries)) +
+                        ''.join(entries))
+        self.numUnsaved = 0
+
+    def load(self):
+        with open(self.cachePath, 'rb') as f:
+            magic, version, boardSize, N, numEntries = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or boardSize != self.boardSize or N != self.N:
+                raise IOError('Not a solver cache for ' + str(self.boardSize) + 'x' + str(self.boardSize) +
+                              ', N = ' + str(self.N) + ': ' + self.cachePath)
+            for _ in range(numEntries):
+                hash, attacker, proved = ENTRY.unpack(f.read(ENTRY.size))
+                self.tables[attacker][hash] = (0, INFINITY) if proved else (INFINITY, 0)
+
+if __name__ == '__main__':
+    # Solves a position: python solver.py boardSize N [x,y ...] [--cache=file] [--maxNodes=M]
+    # The moves are played in turn from the empty board, starting with player 0.
+    options = parseOptions(sys.argv[1:])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 2:
+        print "Usage: python solver.py boardSize N [x,y ...] [--cache=file] [--maxNodes=M]"
+    else:
+        boardSize = int(args[0])
+        N = int(args[1])
+        state = GameState(N, boardSize, 2)
+        for i, move in enumerate(args[2:]):
+            x, y = move.split(',')
+            state.makeMove(i % 2, (int(x), int(y)))
+        solver = ProofNumberSolver(boardSize, N, cachePath = options.get('cache'))
+        maxNodes = int(options['maxNodes']) if 'maxNodes' in options else None
+        result = solver.solve(state, maxNodes)
+        if result == None:
+            print "Not solved within " + str(maxNodes) + " nodes"
+        else:
+            print "Player " + str(state.currentPlayer) + " to move: " + RESULT_NAMES[result] + \
+                " (" + str(solver.numNodes) + " nodes)"
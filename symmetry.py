@@ -0,0 +1,52 @@
+"""
+The 8 symmetries of a square board (rotations and reflections).
+
+Transform t maps (x, y) by transposing it if t & 4, then mirroring x if t & 1,
+then mirroring y if t & 2. Transform 0 is the identity.
+Positions that are transforms of each other have the same canonical hash
+(see GameState.getCanonicalHash), so caches and books can share what they know
+about them.
+"""
+
+NUM_SYMMETRIES = 8
+
+def transformMove(transform, move, boardSize):
+    """
+    Returns where transform takes move.
+    """
+    x, y = move
+    if transform & 4:
+        x, y = y, x
+    if transform & 1:
+        x = boardSize - 1 - x
+    if transform & 2:
+        y = boardSize - 1 - y
+    return (x, y)
+
+def inverseTransformMove(transform, move, boardSize):
+    """
+    Returns the move that transform takes to move.
+    """
+    x, y = move
+    if transform & 2:
+        y = boardSize - 1 - y
+    if transform & 1:
+        x = boardSize - 1 - x
+    if transform & 4:
+        x, y = y, x
+    return (x, y)
+
+def transformCells(boardSize):
+    """
+    Returns cells[transform][y * boardSize + x], the cell index (y' * boardSize + x')
+    that transform takes (x, y) to.
+    """
+    cells = []
+    for transform in range(NUM_SYMMETRIES):
+        row = []
+        for y in range(boardSize):
+            for x in range(boardSize):
+                tx, ty = transformMove(transform, (x, y), boardSize)
+                row.append(ty * boardSize + tx)
+        cells.append(row)
+    return cells
@@ -0,0 +1,120 @@
+"""
+TD(lambda) training of a linear evaluation over binary features.
+
+The value of a state is the sum of the weights of its features (the keys of
+GameState.getFeatures, as in MinimaxAgent.evaluationFunction). Each transition
+costs one pass over the state's features to compute the TD error, and one pass
+over the eligibility trace to apply it, so an update is linear in the number of
+active features.
+"""
+
+from math import sqrt
+
+TRACE_CUTOFF = 1e-3 # traces that decay below this are dropped, to keep them sparse
+
+def inverseSqrtSchedule(initialStep):
+    """
+    Step size initialStep / sqrt(gameNum + 1), the schedule learnWeights always used.
+    """
+    return lambda gameNum: initialStep / sqrt(gameNum + 1)
+
+def constantSchedule(step):
+    return lambda gameNum: step
+
+class TDTrainer():
+    """
+    Applies TD(lambda) updates to a weight dictionary in place.
+
+    Parameters:
+        weights:      A dictionary of (feature => weight), updated in place
+        lambda_:      Trace decay. 0 is TD(0): each update only changes the features of its state
+        gamma:        Discount of the successor's value
+        stepSchedule: A function of the game number returning the step size
+                      (default: inverseSqrtSchedule(0.2))
+        batchSize:    Number of transitions whose updates are summed and applied together.
+                      The TD errors of a batch are all computed with the weights from before it.
+
+    Instance variables:
+        traces:  stream => dictionary of (feature => eligibility). Interleaved
+                 transition streams (such as one per player index) keep separate traces.
+        pending: The summed updates of the current batch, not applied yet
+        gameNum: Number of games finished (see endGame)
+        step:    The current step size
+        numUpdates: Number of transitions trained on
+    """
+
+    def __init__(self, weights, lambda_ = 0.0, gamma = 1.0, stepSchedule = None, batchSize = 1):
+        self.weights = weights
+        self.lambda_ = lambda_
+        self.gamma = gamma
+        self.stepSchedule = stepSchedule if stepSchedule != None else inverseSqrtSchedule(0.2)
+        self.batchSize = batchSize
+        self.traces = {}
+        self.pending = {}
+        self.numPending = 0
+        self.gameNum = 0
+        self.step = self.stepSchedule(0)
+        self.numUpdates = 0
+
+    def value(self, features):
+        weights = self.weights
+        return sum(weights.get(feature, 0) for feature in features)
+
+    def update(self, stateFeatures, reward, successorFeatures, ended, stream = 0):
+        """
+        Train on one transition. Features are lists of feature keys (duplicates count once).
+        If ended, the successor is an end state and its value is not used.
+        """
+        stateFeatures = set(stateFeatures)
+        target = reward
+        if not ended:
+            target += self.gamma * self.value(set(successorFeatures))
+        error = target - self.value(stateFeatures)
+
+        decay = self.gamma * self.lambda_
+        trace = self.traces.get(stream)
+        if trace == None or decay == 0:
+            trace = {}
+        else:
+            for feature in trace.keys():
+                trace[feature] *= decay
+                if trace[feature] < TRACE_CUTOFF:
+                    del trace[feature]
+        for feature in stateFeatures:
+            trace[feature] = trace.get(feature, 0) + 1
+        # The trace of a stream ends with its episode
+        self.traces[stream] = trace if not ended else {}
+
+        change = self.step * error
+        if self.batchSize <= 1:
+            weights = self.weights
+            for feature, eligibility in trace.iteritems():
+                weights[feature] = weights.get(feature, 0) + change * eligibility
+        else:
+            pending = self.pending
+            for feature, eligibility in trace.iteritems():
+                pending[feature] = pending.get(feature, 0) + change * eligibility
+            self.numPending += 1
+            if self.numPending >= self.batchSize:
+                self.flush()
+        self.numUpdates += 1
+        return error
+
+    def flush(self):
+        """
+        Apply the updates of an unfinished batch.
+        """
+        weights = self.weights
+        for feature, change in self.pending.iteritems():
+            weights[feature] = weights.get(feature, 0) + change
+        self.pending = {}
+        self.numPending = 0
+
+    def endGame(self):
+        """
+        Called after the last transition of every game: drops the traces and moves
+        on to the next step size.
+        """
+        self.traces = {}
+        self.gameNum += 1
+        self.step = self.stepSchedule(self.gameNum)
@@ -0,0 +1,273 @@
+"""
+Checks of the engine and its tools, on seeded random games and small known positions.
+
+    python -m unittest tests
+"""
+
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from gameState import GameState
+from batchFeatures import statesToBoards, extractFeatures
+from transposition import TranspositionTable
+from weightStore import WeightTable, convertPickle, loadWeights
+from tdTrainer import TDTrainer, constantSchedule
+from learning import tdUpdate
+from gameRecord import GameRecord, GameRecordWriter, readGameRecords
+from openingBook import BookBuilder, loadBook
+from symmetry import NUM_SYMMETRIES, transformMove, inverseTransformMove
+from threats import findForcedWin
+from patterns import FIVE
+from solver import ProofNumberSolver, WIN, DRAW, LOSS
+from batchSimulator import BatchSimulator
+
+CONFIGS = [(5, 3, 2), (7, 4, 2), (9, 5, 2), (9, 4, 3)] # (boardSize, N, numPlayers)
+NUM_GAMES = 4
+
+def randomGames(seed):
+    """
+    Yields the states of random games of every config, after every move.
+    The same state object is yielded again after each move.
+    """
+    rand = random.Random(seed)
+    for boardSize, N, numPlayers in CONFIGS:
+        for _ in range(NUM_GAMES):
+            state = GameState(N, boardSize, numPlayers)
+            player = 0
+            while not state.gameEnded():
+                state.makeMove(player, rand.choice(sorted(state.getLegalActions())))
+                player = (player + 1) % numPlayers
+                yield state
+
+def randomRecord(rand, boardSize, N, numPlayers):
+    """
+    Plays a random game and returns its GameRecord.
+    """
+    state = GameState(N, boardSize, numPlayers)
+    moves = []
+    while not state.gameEnded():
+        move = rand.choice(sorted(state.getLegalActions()))
+        state.makeMove(len(moves) % numPlayers, move)
+        moves.append(move)
+    return GameRecord(boardSize, N, numPlayers, ['RandomAgent'] * numPlayers, moves, state.getWinner())
+
+def snapshot(state):
+    return (state.hash, list(state.symmetryHashes), dict(state.features), list(state.featureCounts),
+            set(state.legalActions), dict(state.positionToFeatures.items()), dict(state.board.items()),
+            state.currentPlayer, state.gameOver, state.winner, state.previousAction)
+
+class MakeUndoTest(unittest.TestCase):
+    def testRoundTrip(self):
+        rand = random.Random(1)
+        for state in randomGames(1):
+            if state.gameEnded():
+                continue
+            before = snapshot(state)
+            for move in rand.sample(sorted(state.getLegalActions()), 3):
+                state.makeMove(state.currentPlayer, move)
+                state.undoMove()
+                self.assertEqual(snapshot(state), before)
+
+class BatchFeaturesTest(unittest.TestCase):
+    def testExtractFeaturesMatchesGameState(self):
+        for state in randomGames(0):
+            boards = statesToBoards([state])
+            self.assertEqual(extractFeatures(boards, state.numPlayers)[0], state.features)
+
+class TranspositionTableTest(unittest.TestCase):
+    def testStoreAndProbe(self):
+        table = TranspositionTable(0) # one slot, so every key collides
+        table.store(12345, 3, TranspositionTable.EXACT, 7.5, (1, 2))
+        self.assertEqual(table.probe(12345), (3, TranspositionTable.EXACT, 7.5, (1, 2)))
+        self.assertEqual(table.probe(54321), None)
+
+    def testReplacement(self):
+        table = TranspositionTable(0)
+        table.newSearch()
+        table.store(1, 4, TranspositionTable.LOWER, 1.0, (0, 0))
+        table.store(2, 2, TranspositionTable.EXACT, 2.0, (1, 1)) # shallower, same search: kept out
+        self.assertEqual(table.probe(2), None)
+        table.store(1, 1, TranspositionTable.UPPER, 3.0, (2, 2)) # same position: replaced
+        self.assertEqual(table.probe(1), (1, TranspositionTable.UPPER, 3.0, (2, 2)))
+        table.newSearch()
+        table.store(2, 0, TranspositionTable.EXACT, 2.0, (1, 1)) # older search: replaced
+        self.assertEqual(table.probe(2), (0, TranspositionTable.EXACT, 2.0, (1, 1)))
+        self.assertEqual(table.probe(1), None)
+
+class WeightStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testConvertAndLoad(self):
+        weights = {('open 2', 3, True, False): 1.5, ('blocked 3', 0, False, True): -2.25, 'bias': 0.0}
+        picklePath = os.path.join(self.directory, 'weights.p')
+        with open(picklePath, 'wb') as f:
+            pickle.dump(weights, f)
+        path = convertPickle(picklePath)
+        self.assertEqual(dict(WeightTable(path).items()), weights)
+        loaded = loadWeights(picklePath) # uses the converted file next to the pickle
+        self.assertTrue(isinstance(loaded, WeightTable))
+        self.assertEqual(dict(loaded.items()), weights)
+        self.assertEqual(loaded.get('missing', 4.0), 4.0)
+
+class TDTrainerTest(unittest.TestCase):
+    def testLambdaZeroMatchesTdUpdate(self):
+        # tdUpdate changes one weight at a time, so the two agree on single feature states
+        rand = random.Random(2)
+        transitions = []
+        for _ in range(50):
+            transitions.append((['f' + str(rand.randrange(5))], rand.choice([0, 0, 0, 100, -100]),
+                                ['f' + str(rand.randrange(5))], rand.random() < 0.2))
+        expected = {}
+        weights = {}
+        trainer = TDTrainer(weights, lambda_ = 0.0, gamma = 0.9, stepSchedule = constantSchedule(0.01))
+        for stateFeatures, reward, successorFeatures, ended in transitions:
+            tdUpdate(expected, stateFeatures, reward, successorFeatures, ended, 0.01, 0.9)
+            trainer.update(stateFeatures, reward, successorFeatures, ended)
+        self.assertEqual(sorted(weights), sorted(expected))
+        for key in expected:
+            self.assertAlmostEqual(weights[key], expected[key])
+
+class GameRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRoundTrip(self):
+        rand = random.Random(3)
+        records = [randomRecord(rand, boardSize, N, numPlayers) for boardSize, N, numPlayers in CONFIGS]
+        path = os.path.join(self.directory, 'games.rec')
+        with GameRecordWriter(path, bufferSize = 64) as writer:
+            for record in records[:2]:
+                writer.writeRecord(record)
+        with GameRecordWriter(path) as writer: # appends
+            for record in records[2:]:
+                writer.writeRecord(record)
+        with open(path, 'ab') as f: # a game cut short
+            f.write('\x09\x05')
+        read = list(readGameRecords(path))
+        self.assertEqual([[getattr(record, name) for name in GameRecord.__slots__] for record in read],
+                         [[getattr(record, name) for name in GameRecord.__slots__] for record in records])
+
+class OpeningBookTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testBuildAndLookup(self):
+        games = [([(0, 0), (1, 1), (0, 1)], 1), ([(0, 0), (1, 1), (1, 0)], 1), ([(0, 0), (0, 1)], 0)]
+        builder = BookBuilder(7, 4, maxPly = 4)
+        for moves, winner in games:
+            self.assertTrue(builder.addGame(GameRecord(7, 4, 2, ['A', 'B'], moves, winner)))
+        self.assertFalse(builder.addGame(GameRecord(9, 4, 2, ['A', 'B'], [(0, 0)], 0)))
+        path = os.path.join(self.directory, 'book.bin')
+        builder.write(path)
+        book = loadBook(path)
+
+        # (6, 6) and (6, 0) are symmetries of (0, 0), so the replies are the symmetries of (1, 1)
+        for corner, reply in [((0, 0), (1, 1)), ((6, 6), (5, 5)), ((6, 0), (5, 1))]:
+            state = GameState(4, 7, 2)
+            state.makeMove(0, corner)
+            self.assertEqual(book.bestMove(state), reply)
+            self.assertEqual(book.bestMove(state, minSamples = 3), None)
+        state.makeMove(1, (5, 0))
+        self.assertEqual(book.bestMove(state), None)
+
+class SymmetryTest(unittest.TestCase):
+    def testCanonicalHash(self):
+        rand = random.Random(4)
+        for boardSize, N, numPlayers in CONFIGS:
+            record = randomRecord(rand, boardSize, N, numPlayers)
+            states = [GameState(N, boardSize, numPlayers) for _ in range(NUM_SYMMETRIES)]
+            for i, (player, move) in enumerate(record.playerMoves()):
+                for transform, state in enumerate(states):
+                    self.assertTrue(state.makeMove(player, transformMove(transform, move, boardSize)))
+                hashes = set(state.getCanonicalHash()[0] for state in states)
+                self.assertEqual(len(hashes), 1)
+                # The transform takes the position to the one with the canonical hash
+                canonical, transform = states[0].getCanonicalHash()
+                state = GameState(N, boardSize, numPlayers)
+                for earlierPlayer, earlierMove in record.playerMoves()[:i + 1]:
+                    state.makeMove(earlierPlayer, transformMove(transform, earlierMove, boardSize))
+                self.assertEqual(state.hash, canonical)
+                self.assertEqual(inverseTransformMove(transform, transformMove(transform, move, boardSize), boardSize), move)
+
+class ThreatSearchTest(unittest.TestCase):
+    def position(self):
+        """
+        Player 0 to move wins by a four on row 6 at (6, 6), forcing (5, 6), then a double
+        four on row 7 and column 6 at (6, 7) (or the same two moves the other way around).
+        """
+        attacker = [(3, 7), (4, 7), (5, 7), (6, 4), (6, 5), (7, 6), (8, 6), (9, 6)]
+        defender = [(2, 7), (6, 3), (10, 6), (0, 14), (2, 14), (4, 14), (14, 0), (14, 2)]
+        state = GameState(5, 15, 2)
+        for attackerMove, defenderMove in zip(attacker, defender):
+            state.makeMove(0, attackerMove)
+            state.makeMove(1, defenderMove)
+        return state
+
+    def fives(self, state, player):
+        return [cell for cell in sorted(state.getLegalActions()) if max(state.getMoveShapes(player, cell)) == FIVE]
+
+    def testFindsVCF(self):
+        state = self.position()
+        before = state.hash
+        line = findForcedWin(state, 0)
+        self.assertEqual(state.hash, before)
+        self.assertEqual(sorted(line), [(6, 6), (6, 7)])
+        self.assertEqual(findForcedWin(state, 0, maxDepth = 1), None)
+        # Play the line out, the defender blocking every four
+        for move in line:
+            state.makeMove(0, move)
+            state.makeMove(1, self.fives(state, 0)[0])
+        state.makeMove(0, self.fives(state, 0)[0])
+        self.assertEqual(state.getWinner(), 0)
+
+    def testNoVCFWithoutFours(self):
+        state = GameState(5, 15, 2)
+        for attackerMove, defenderMove in [((7, 7), (0, 0)), ((8, 7), (0, 14))]:
+            state.makeMove(0, attackerMove)
+            state.makeMove(1, defenderMove)
+        self.assertEqual(findForcedWin(state, 0), None)
+
+class SolverTest(unittest.TestCase):
+    def testTicTacToeIsADraw(self):
+        self.assertEqual(ProofNumberSolver(3, 3).solve(GameState(3, 3, 2)), DRAW)
+
+    def testThreeInARowOnFourByFourIsAWin(self):
+        solver = ProofNumberSolver(4, 3)
+        state = GameState(3, 4, 2)
+        self.assertEqual(solver.solve(state), WIN)
+        move, result = solver.bestMove(state)
+        self.assertEqual(result, WIN)
+        state.makeMove(0, move)
+        self.assertEqual(solver.solve(state), LOSS)
+
+class BatchSimulatorTest(unittest.TestCase):
+    def testGamesReplayThroughGameState(self):
+        for boardSize, N, numPlayers in CONFIGS:
+            simulator = BatchSimulator(boardSize, N, batchSize = 8, numPlayers = numPlayers, seed = 5)
+            numGames = 0
+            for winner, moves in simulator.run(20): # more games than slots, so slots are refilled
+                numGames += 1
+                state = GameState(N, boardSize, numPlayers)
+                for i, move in enumerate(moves):
+                    self.assertFalse(state.gameEnded())
+                    self.assertTrue(move in state.getLegalActions())
+                    state.makeMove(i % numPlayers, move)
+                self.assertTrue(state.gameEnded())
+                self.assertEqual(state.getWinner(), winner)
+            self.assertEqual(numGames, 20)
+
+if __name__ == '__main__':
+    unittest.main()
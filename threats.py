@@ -0,0 +1,176 @@
+"""
+Threat-space search: forced wins made only of threats (two player games).
+
+A VCF (victory by continuous fours) is a sequence of attacker moves that each
+make a four, so the defender's reply is forced every time, ending in N in a row.
+A VCT (victory by continuous threats) may also use open threes, which the
+defender must answer on the line of the three (or lose to an open four).
+
+Only threat moves are tried, so the search goes much deeper than a full width
+search with the same number of nodes. It is conservative: a win is only reported
+if it holds against every defence, but some wins are not found (for example, a
+VCT fails as soon as the defender could answer a three with a four).
+"""
+
+import time
+from patterns import OPEN_THREE, FOUR, FIVE
+
+_boardMasks = {}
+
+def boardMask(board):
+    """
+    Returns the bitmask of every cell of the board (without the padding column).
+    """
+    key = (board.boardSize, board.width)
+    if not key in _boardMasks:
+        row = (1 << board.boardSize) - 1
+        mask = 0
+        for y in range(board.boardSize):
+            mask |= row << (y * board.width)
+        _boardMasks[key] = mask
+    return _boardMasks[key]
+
+def nearbyCells(board, distance = 2):
+    """
+    Returns the empty cells within distance (in any of the 8 directions) of a stone.
+    Every cell where a move can make a four or a three is within distance 2.
+    """
+    full = boardMask(board)
+    mask = board.occupied
+    for _ in range(distance):
+        grown = mask
+        for shift in board.shifts:
+            grown |= (mask << shift) | (mask >> shift)
+        mask = grown & full
+    free = mask & ~board.occupied
+    width = board.width
+    cells = []
+    while free:
+        low = free & -free
+        index = low.bit_length() - 1
+        cells.append((index % width, index // width))
+        free ^= low
+    return cells
+
+class ThreatSearch():
+    """
+    Searches state (with attacker to move) for a forced win of attacker.
+    The state is changed with makeMove and undoMove, and left as it was.
+
+    Parameters:
+        maxDepth:  Maximum number of attacker moves in a win
+        useThrees: Search for a VCT (fours and open threes), not only a VCF
+        maxNodes:  The search gives up (finding no win) after this many moves
+        deadline:  The search also gives up at this time.time(), if given
+
+    Instance variables:
+        numNodes: Moves made so far
+    """
+
+    def __init__(self, state, attacker, maxDepth = 10, useThrees = False, maxNodes = 2000, deadline = None):
+        self.state = state
+        self.attacker = attacker
+        self.defender = (attacker + 1) % 2
+        self.maxDepth = maxDepth
+        self.useThrees = useThrees
+        self.maxNodes = maxNodes
+        self.deadline = deadline
+        self.numNodes = 0
+
+    def search(self):
+        """
+        Returns the attacker's moves of a forced win (the defender's replies in between
+        are not included, and may vary), or None if none was found.
+        """
+        if self.state.gameEnded() or self.state.numPlayers != 2:
+            return None
+        return self.attack(self.maxDepth)
+
+    def exhausted(self):
+        return self.numNodes >= self.maxNodes or (self.deadline != None and time.time() > self.deadline)
+
+    def shapes(self, player, cells):
+        """
+        Returns a dictionary of (cell => strongest shape player makes by playing there).
+        """
+        state = self.state
+        return dict((cell, max(state.getMoveShapes(player, cell))) for cell in cells)
+
+    def attack(self, depth):
+        state = self.state
+        cells = nearbyCells(state.board)
+        attackerShapes = self.shapes(self.attacker, cells)
+        for cell, shape in attackerShapes.iteritems():
+            if shape == FIVE:
+                return [cell]
+        if depth == 0 or self.exhausted():
+            return None
+
+        defenderFives = [cell for cell, shape in self.shapes(self.defender, cells).iteritems() if shape == FIVE]
+        if len(defenderFives) > 1:
+            return None
+        if len(defenderFives) == 1:
+            # The attacker has to block, and the block has to be a threat itself
+            moves = defenderFives
+            if attackerShapes[moves[0]] < (OPEN_THREE if self.useThrees else FOUR):
+                return None
+        else:
+            minimum = OPEN_THREE if self.useThrees else FOUR
+            moves = [cell for cell, shape in attackerShapes.iteritems() if shape >= minimum]
+            # Strongest threats first
+            moves.sort(key = lambda cell: -attackerShapes[cell])
+
+        for move in moves:
+            self.numNodes += 1
+            state.makeMove(self.attacker, move)
+            line = self.defend(depth)
+            state.undoMove()
+            if line != None:
+                return [move] + line
+            if self.exhausted():
+                return None
+        return None
+
+    def defend(self, depth):
+        """
+        The defender to move after the attacker's threat. Returns the rest of the
+        attacker's win if it wins against every reply, else None.
+        """
+        state = self.state
+        if state.gameEnded():
+            return [] if state.getWinner() == self.attacker else None
+        cells = nearbyCells(state.board)
+        defenderShapes = self.shapes(self.defender, cells)
+        attackerShapes = self.shapes(self.attacker, cells)
+        if any(shape == FIVE for shape in defenderShapes.itervalues()):
+            return None
+        attackerFives = [cell for cell, shape in attackerShapes.iteritems() if shape == FIVE]
+        if len(attackerFives) >= 2:
+            return [] # the defender can only block one of them
+        if len(attackerFives) == 1:
+            replies = attackerFives
+        else:
+            # A three: the defender could answer with a four of its own, which this search does not follow
+            if any(shape >= FOUR for shape in defenderShapes.itervalues()):
+                return None
+            # Every move that stops the open four is one where the attacker would make a four
+            replies = [cell for cell, shape in attackerShapes.iteritems() if shape >= FOUR]
+            if len(replies) == 0:
+                return None
+
+        line = None
+        for reply in replies:
+            self.numNodes += 1
+            state.makeMove(self.defender, reply)
+            line = self.attack(depth - 1)
+            state.undoMove()
+            if line == None:
+                return None
+        return line
+
+def findForcedWin(state, attacker, maxDepth = 10, useThrees = False, maxNodes = 2000, deadline = None):
+    """
+    Returns the attacker's moves of a forced win found by threat-space search
+    (attacker to move in state), or None. See ThreatSearch.
+    """
+    return ThreatSearch(state, attacker, maxDepth, useThrees, maxNodes, deadline).search()
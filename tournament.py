@@ -0,0 +1,248 @@
+"""
+Round robin tournaments between agent configurations, played across processes.
+
+An agent configuration is an agent type letter, as in gomoku.py, followed by
+optional ':'-separated settings:
+    m                                   Minimax with learned weights
+    h:depth=3                           Minimax with hard coded weights, depth 3
+    m:depth=2:branch=8:weights=weightVector Good against humans.p
+    t:time=0.5                          Minimax with a time limit of 0.5 seconds per move
+    r                                   Random
+    u:playouts=5000:prior=1             Monte Carlo tree search, 5000 playouts per move, learned weights prior
+Settings are depth, branch (branching factor), time (seconds per move), weights (weight file)
+workers (processes searching each move, see MinimaxAgent; only with --workers=1), book (opening book file),
+threats (0 turns off the threat-space search), solver (proof-number solver cache file)
+and solverNodes (solver expansions per move). Monte Carlo tree search agents take
+playouts, time, exploration, prior (1 orders the tree by the learned weights) and weights.
+A file name may contain ':' (as in m:weights=weightVector 50:50.p), as long as the part
+after it has no '='.
+
+Every pair of configurations plays gamesPerPairing games with each color.
+Ratings are Bradley-Terry (Elo) fits of all results, with confidence
+intervals from bootstrap resamples of the games.
+"""
+
+import sys
+import time
+import random
+import multiprocessing
+import numpy as np
+from gameState import GameState
+from agents import MinimaxAgent, RandomAgent
+from mcts import MCTSAgent
+from gameRecord import GameRecordWriter
+from util import parseOptions
+
+NUM_BOOTSTRAP_SAMPLES = 200
+PRIOR_TIES = 1 # virtual ties between every pair of agents, so every rating is finite
+
+def parseSpec(spec):
+    """
+    Returns (agent type letter, dictionary of settings) of an agent configuration.
+    """
+    parts = spec.split(':')
+    settings = {}
+    key = None
+    for part in parts[1:]:
+        if not '=' in part:
+            # A ':' in a file name, such as "weightVector 50:50.p"
+            if key == None:
+                raise ValueError('Invalid agent setting ' + part + ' in ' + spec)
+            settings[key] += ':' + part
+            continue
+        key, value = part.split('=', 1)
+        settings[key] = value
+    if not parts[0] in ('m', 'h', 't', 'r', 'u'):
+        raise ValueError('Invalid agent type ' + parts[0] + ' in ' + spec)
+    return (parts[0], settings)
+
+def checkSpecs(specs, numWorkers):
+    """
+    Raises ValueError if a spec is invalid, or has search workers while the games are
+    played in numWorkers processes: pool processes are daemonic and may not start the
+    agent's helper processes.
+    """
+    for spec in specs:
+        settings = parseSpec(spec)[1]
+        if numWorkers != 1 and int(settings.get('workers', 1)) > 1:
+            raise ValueError('Agent setting workers=' + settings['workers'] + ' in ' + spec +
+                             ' needs the games played in one process (--workers=1)')
+
+def makeAgent(spec, index):
+    agentType, settings = parseSpec(spec)
+    if agentType == 'r':
+        return RandomAgent(index, False)
+    kwargs = {}
+    if agentType == 'u':
+        if 'playouts' in settings:
+            kwargs['numPlayouts'] = int(settings['playouts'])
+        if 'time' in settings:
+            kwargs['timeLimit'] = float(settings['time'])
+        if 'exploration' in settings:
+            kwargs['exploration'] = float(settings['exploration'])
+        if 'prior' in settings:
+            kwargs['usePrior'] = settings['prior'] != '0'
+        if 'weights' in settings:
+            kwargs['weightsFile'] = settings['weights']
+        return MCTSAgent(index, False, **kwargs)
+    if agentType == 'h':
+        kwargs['depth'] = 3
+        kwargs['hardCodedWeights'] = True
+    if agentType == 't':
+        kwargs['timeLimit'] = 1.0
+    if 'depth' in settings:
+        kwargs['depth'] = int(settings['depth'])
+    if 'branch' in settings:
+        kwargs['branchingFactor'] = int(settings['branch'])
+    if 'time' in settings:
+        kwargs['timeLimit'] = float(settings['time'])
+    if 'weights' in settings:
+        kwargs['weightsFile'] = settings['weights']
+    if 'workers' in settings:
+        kwargs['numWorkers'] = int(settings['workers'])
+    if 'book' in settings:
+        kwargs['openingBook'] = settings['book']
+    if 'threats' in settings:
+        kwargs['threatSearch'] = settings['threats'] != '0'
+    if 'solver' in settings:
+        kwargs['solver'] = settings['solver']
+    if 'solverNodes' in settings:
+        kwargs['solverMaxNodes'] = int(settings['solverNodes'])
+    return MinimaxAgent(index, False, **kwargs)
+
+def playGame(game):
+    """
+    Plays one game of (boardSize, N, first, second, specs, seed), where first and
+    second index the agent configurations (specs) playing as players 0 and 1.
+    Returns (first, second, winner, moves, [time taken by player 0, player 1]).
+    """
+    boardSize, N, first, second, specs, seed = game
+    random.seed(seed)
+    agents = [makeAgent(specs[0], 0), makeAgent(specs[1], 1)]
+    state = GameState(N, boardSize, 2)
+    moves = []
+    timeTaken = [0.0, 0.0]
+    agentIndex = 0
+    while not state.gameEnded():
+        startTime = time.time()
+        action = agents[agentIndex].getAction(state)
+        timeTaken[agentIndex] += time.time() - startTime
+        state.makeMove(agentIndex, action)
+        moves.append(action)
+        agentIndex = (agentIndex + 1) % 2
+    return (first, second, state.getWinner(), moves, timeTaken)
+
+def fitRatings(results, numAgents, iterations = 200):
+    """
+    Bradley-Terry fit of results, a list of (first, second, winner) with winner
+    0, 1 or -1 (a tie counts half a win for each). Returns an array of Elo ratings with mean 0.
+    Uses the minorization-maximization updates of Hunter (2004).
+    """
+    wins = np.zeros((numAgents, numAgents))
+    for first, second, winner in results:
+        if winner == 0:
+            wins[first, second] += 1
+        elif winner == 1:
+            wins[second, first] += 1
+        else:
+            wins[first, second] += 0.5
+            wins[second, first] += 0.5
+    wins += PRIOR_TIES * 0.5 * (1 - np.eye(numAgents))
+    games = wins + wins.T
+    totalWins = wins.sum(axis = 1)
+    gamma = np.ones(numAgents)
+    for _ in range(iterations):
+        newGamma = totalWins / (games / (gamma[:, None] + gamma[None, :])).sum(axis = 1)
+        newGamma /= np.exp(np.log(newGamma).mean())
+        if np.abs(newGamma - gamma).max() < 1e-9:
+            gamma = newGamma
+            break
+        gamma = newGamma
+    return 400 * np.log10(gamma)
+
+def bootstrapIntervals(results, numAgents, numSamples = NUM_BOOTSTRAP_SAMPLES, seed = 0):
+    """
+    Returns (low, high) arrays of the 95% confidence interval of every rating.
+    """
+    rng = np.random.RandomState(seed)
+    samples = []
+    for _ in range(numSamples):
+        sample = [results[i] for i in rng.randint(0, len(results), len(results))]
+        samples.append(fitRatings(sample, numAgents))
+    samples = np.array(samples)
+    return (np.percentile(samples, 2.5, axis = 0), np.percentile(samples, 97.5, axis = 0))
+
+def runTournament(boardSize, N, specs, gamesPerPairing, numWorkers = None, recordPath = None, seed = 0):
+    """
+    Plays every pair of specs gamesPerPairing times with each color, in numWorkers
+    processes (default: one per core), and prints the ratings.
+    Returns a list of (spec, elo, low, high, score, games, average move time).
+    """
+    checkSpecs(specs, numWorkers)
+    games = []
+    for i in range(len(specs)):
+        for j in range(i + 1, len(specs)):
+            for k in range(gamesPerPairing):
+                for first, second in [(i, j), (j, i)]:
+                    games.append((boardSize, N, first, second, (specs[first], specs[second]), seed + len(games)))
+
+    recordWriter = GameRecordWriter(recordPath) if recordPath != None else None
+    pool = multiprocessing.Pool(numWorkers) if numWorkers != 1 else None
+    startTime = time.time()
+    results = []
+    timeTaken = [0.0] * len(specs)
+    numMoves = [0] * len(specs)
+    points = [0.0] * len(specs)
+    numGames = [0] * len(specs)
+    played = pool.imap_unordered(playGame, games) if pool != None else (playGame(game) for game in games)
+    for first, second, winner, moves, gameTime in played:
+        results.append((first, second, winner))
+        for player, agent in enumerate([first, second]):
+            timeTaken[agent] += gameTime[player]
+            numMoves[agent] += (len(moves) + 1 - player) / 2
+            numGames[agent] += 1
+            points[agent] += 1 if winner == player else 0.5 if winner == -1 else 0
+        if recordWriter != None:
+            recordWriter.write(boardSize, N, 2, [specs[first], specs[second]], moves, winner)
+        print "Game " + str(len(results)) + "/" + str(len(games)) + ": " + specs[first] + " vs " + specs[second] + \
+            ", winner " + str(winner)
+    elapsed = time.time() - startTime
+    if pool != None:
+        pool.close()
+        pool.join()
+    if recordWriter != None:
+        recordWriter.close()
+
+    ratings = fitRatings(results, len(specs))
+    low, high = bootstrapIntervals(results, len(specs))
+    table = []
+    for i in range(len(specs)):
+        table.append((specs[i], ratings[i], low[i], high[i], points[i] / max(numGames[i], 1), numGames[i],
+                      timeTaken[i] / max(numMoves[i], 1)))
+
+    print "================= Tournament results ==================="
+    print "%-40s %7s %17s %7s %6s %10s" % ('Agent', 'Elo', '95% interval', 'Score', 'Games', 'Move time')
+    for spec, elo, lo, hi, score, n, moveTime in sorted(table, key = lambda row: -row[1]):
+        print "%-40s %7.1f [%7.1f, %7.1f] %6.1f%% %6d %9.4fs" % (spec, elo, lo, hi, score * 100, n, moveTime)
+    print "Games: " + str(len(results)) + " in " + ("%.1f" % elapsed) + "s, " + \
+        ("%.2f" % (len(results) / max(elapsed, 1e-9))) + " games per second"
+    return table
+
+if __name__ == '__main__':
+    # Arguments: boardSize N gamesPerPairing spec1 spec2 [spec3 ...] [--workers=W] [--record=file] [--seed=S]
+    # Ex: python tournament.py 9 5 10 h m "m:weights=weightVector Good against humans.p" --workers=4
+    options = parseOptions(sys.argv[1:])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 5:
+        print "Usage: python tournament.py boardSize N gamesPerPairing spec1 spec2 [spec3 ...] " + \
+            "[--workers=W] [--record=file] [--seed=S]"
+    else:
+        specs = args[3:]
+        numWorkers = int(options['workers']) if 'workers' in options else None
+        try:
+            checkSpecs(specs, numWorkers) # fail before starting any game
+        except ValueError as e:
+            print "Error: " + str(e)
+            sys.exit(2)
+        runTournament(int(args[0]), int(args[1]), specs, int(args[2]), numWorkers,
+                      options.get('record'), int(options.get('seed', 0)))
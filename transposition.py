@@ -0,0 +1,135 @@
+import ctypes
+import struct
+from multiprocessing.sharedctypes import RawArray
+
+class TranspositionTable():
+    """
+    A fixed size table of search results, indexed by Zobrist hash.
+
+    Each slot holds one entry (hash, depth, flag, score, move, generation).
+    A new entry replaces the old one if the slot is empty, holds the same
+    position, was written by an earlier search (generation), or was searched
+    less deeply.
+
+    Parameter:
+        maxMemoryMB: Rough memory cap of the table, in megabytes
+    """
+
+    EXACT = 0
+    LOWER = 1 # score is a lower bound of the real score
+    UPPER = 2 # score is an upper bound of the real score
+
+    ENTRY_BYTES = 160 # rough size of a slot and the tuple stored in it
+
+    def __init__(self, maxMemoryMB = 16):
+        self.size = max(1, int(maxMemoryMB * 1024 * 1024 / self.ENTRY_BYTES))
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def newSearch(self):
+        """
+        Called at the start of every search, so older entries are replaced first.
+        """
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key):
+        """
+        Returns (depth, flag, score, move) stored for key, None if there is none.
+        """
+        entry = self.entries[key % self.size]
+        if entry == None or entry[0] != key:
+            return None
+        return entry[1:5]
+
+    def store(self, key, depth, flag, score, move):
+        slot = key % self.size
+        entry = self.entries[slot]
+        if entry == None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[slot] = (key, depth, flag, score, move, self.generation)
+
+class SharedTranspositionTable():
+    """
+    A TranspositionTable in shared memory, for search processes forked from
+    the one that made it (see MinimaxAgent numWorkers). Same interface and
+    replacement rule as TranspositionTable.
+
+    There are no locks. Each slot is three 64 bit words: check, data and the
+    bits of the score, where check = hash ^ data ^ score bits. A slot that
+    another process was writing at the same time fails the check, and reads
+    as empty.
+
+    data is: depth (8 bits), flag (2), whether there is a move (1),
+    move x (8), move y (8), generation (16), and a bit set in every entry,
+    so an empty (all zero) slot never holds an entry.
+
+    Parameter:
+        maxMemoryMB: Memory of the table, in megabytes
+    """
+
+    ENTRY_BYTES = 24
+    MASK = (1 << 64) - 1
+    USED = 1 << 43
+
+    def __init__(self, maxMemoryMB = 16):
+        self.size = max(1, int(maxMemoryMB * 1024 * 1024 / self.ENTRY_BYTES))
+        self.slots = RawArray(ctypes.c_uint64, 3 * self.size)
+        self.generation = 0
+
+    def newSearch(self):
+        self.generation += 1
+
+    def clear(self):
+        ctypes.memset(self.slots, 0, ctypes.sizeof(self.slots))
+        self.generation = 0
+
+    def read(self, key):
+        """
+        Returns (data, score) of the slot of key if it holds key, else None.
+        """
+        key &= self.MASK
+        i = 3 * (key % self.size)
+        slots = self.slots
+        data = slots[i + 1]
+        scoreBits = slots[i + 2]
+        if slots[i] ^ data ^ scoreBits != key or data == 0:
+            return None
+        return (data, _doubleFromBits(scoreBits))
+
+    def probe(self, key):
+        entry = self.read(key)
+        if entry == None:
+            return None
+        data, score = entry
+        move = None
+        if (data >> 10) & 1:
+            move = (int((data >> 11) & 0xff), int((data >> 19) & 0xff))
+        return (int(data & 0xff), int((data >> 8) & 3), score, move)
+
+    def store(self, key, depth, flag, score, move):
+        key &= self.MASK
+        i = 3 * (key % self.size)
+        slots = self.slots
+        data = slots[i + 1]
+        if data != 0 and (slots[i] ^ data ^ slots[i + 2]) != key and \
+                ((data >> 27) & 0xffff) == (self.generation & 0xffff) and depth < (data & 0xff):
+            return
+        data = self.USED | min(depth, 0xff) | (flag << 8) | ((self.generation & 0xffff) << 27)
+        if move != None:
+            data |= (1 << 10) | (move[0] << 11) | (move[1] << 19)
+        scoreBits = _bitsFromDouble(score)
+        slots[i] = key ^ data ^ scoreBits
+        slots[i + 1] = data
+        slots[i + 2] = scoreBits
+
+_double = struct.Struct('<d')
+_bits = struct.Struct('<Q')
+
+def _bitsFromDouble(value):
+    return _bits.unpack(_double.pack(value))[0]
+
+def _doubleFromBits(bits):
+    return _double.unpack(_bits.pack(bits))[0]
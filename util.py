@@ -1,3 +1,5 @@
+import os
+
 # Check if string represents an int
 # http://stackoverflow.com/questions/1265665/python-check-if-a-string-represents-an-int-without-using-try-except
 def isInt(str):
@@ -36,3 +38,19 @@ def dotProduct(d1, d2):
         return dotProduct(d2, d1)
     else:
         return sum(d1.get(f, 0) * v for f, v in d2.items())
+
+def parseOptions(args):
+    """
+    Returns a dictionary of (name => value) of the --name=value arguments in args.
+    """
+    return dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+
+def writeAtomically(path, data):
+    """
+    Write the string data to path. It goes to a temporary file that is then renamed
+    over path, so no other process ever reads or maps half a file.
+    """
+    temporaryPath = path + '.tmp' + str(os.getpid())
+    with open(temporaryPath, 'wb') as f:
+        f.write(data)
+    os.rename(temporaryPath, path)
@@ -0,0 +1,147 @@
+"""
+Compact binary weight files, memory-mapped once per process.
+
+A weight file is:
+    header:     magic 'GMKW', format version, number of keys, size of the key table
+    key table:  the weight keys, as one marshalled tuple, in slot order
+    padding:    up to the next multiple of 8 bytes
+    values:     one little-endian float64 per key, in slot order
+
+The values are never copied out of the file: every agent in a process shares
+one read-only mapping, and forked worker processes share its pages as well.
+"""
+
+import marshal
+import mmap
+import os
+import pickle
+import struct
+import sys
+import numpy as np
+from util import writeAtomically
+
+MAGIC = 'GMKW'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQ')
+BINARY_EXTENSION = '.w'
+
+class WeightTable():
+    """
+    A read-only dictionary of (weight key => float) backed by a memory-mapped weight file.
+
+    Instance variables:
+        path:   The file the table was loaded from
+        slots:  A dictionary of (weight key => slot index)
+        values: A float64 numpy array over the mapped file, values[slot] is the weight
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, numKeys, keyTableSize = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            raise IOError('Not a weight file (version ' + str(VERSION) + '): ' + path)
+        keys = marshal.loads(self.mapping[HEADER.size:HEADER.size + keyTableSize])
+        self.slots = dict((key, slot) for slot, key in enumerate(keys))
+        self.values = np.frombuffer(self.mapping, dtype = '<f8', count = numKeys,
+                                    offset = valuesOffset(keyTableSize))
+
+    def get(self, key, default = None):
+        slot = self.slots.get(key)
+        if slot == None:
+            return default
+        return float(self.values[slot])
+
+    def __getitem__(self, key):
+        return float(self.values[self.slots[key]])
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def keys(self):
+        return self.slots.keys()
+
+    def items(self):
+        values = self.values.tolist()
+        return [(key, values[slot]) for key, slot in self.slots.iteritems()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+def valuesOffset(keyTableSize):
+    end = HEADER.size + keyTableSize
+    return (end + 7) // 8 * 8
+
+def binaryPath(picklePath):
+    """
+    The name of the binary weight file converted from a pickled one.
+    """
+    root, _ = os.path.splitext(picklePath)
+    return root + BINARY_EXTENSION
+
+def writeWeights(weights, path):
+    """
+    Write a dictionary of (weight key => float) as a binary weight file.
+    """
+    keys = tuple(weights.keys())
+    keyTable = marshal.dumps(keys)
+    padding = valuesOffset(len(keyTable)) - HEADER.size - len(keyTable)
+    values = np.array([weights[key] for key in keys], dtype = '<f8')
+    writeAtomically(path, HEADER.pack(MAGIC, VERSION, len(keys), len(keyTable)) + keyTable + '\0' * padding +
+                    values.tostring())
+
+def convertPickle(picklePath, path = None):
+    """
+    Convert a pickled weight dictionary (such as weightVector.p) to a binary weight file.
+    Returns the path of the binary file.
+    """
+    if path == None:
+        path = binaryPath(picklePath)
+    with open(picklePath, 'rb') as f:
+        weights = pickle.load(f)
+    writeWeights(weights, path)
+    return path
+
+_loaded = {}
+
+def loadWeights(path):
+    """
+    Returns the weights stored at path, loading them at most once per process.
+
+    path may be a binary weight file, or a pickled one. For a pickled file, a
+    binary file converted from it (see binaryPath) is used instead if it is
+    at least as new, or if the pickle is missing. Raises IOError if there is no such file.
+    """
+    path = os.path.abspath(path)
+    if path in _loaded:
+        return _loaded[path]
+
+    candidate = binaryPath(path)
+    if candidate != path and os.path.exists(candidate) and \
+            (not os.path.exists(path) or os.path.getmtime(candidate) >= os.path.getmtime(path)):
+        weights = WeightTable(candidate)
+    else:
+        with open(path, 'rb') as f:
+            isBinary = f.read(len(MAGIC)) == MAGIC
+        if isBinary:
+            weights = WeightTable(path)
+        else:
+            with open(path, 'rb') as f:
+                weights = pickle.load(f)
+
+    _loaded[path] = weights
+    return weights
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) < 1 or len(args) > 2:
+        print "Usage: python weightStore.py weights.p [output" + BINARY_EXTENSION + "]"
+    else:
+        print "Wrote " + convertPickle(*args)
@@ -0,0 +1,34 @@
+import random
+from symmetry import NUM_SYMMETRIES, transformCells
+
+# Fixed seed, so hashes are the same in every process and every run
+ZOBRIST_SEED = 221
+
+class ZobristKeys():
+    """
+    Random 64 bit keys for Zobrist hashing a board.
+
+    Instance variables:
+        pieces: pieces[player][y * boardSize + x] is the key of a stone of player at (x, y)
+        turns:  turns[player] is the key of player being the one to move
+        symmetricPieces: symmetricPieces[player][y * boardSize + x][transform] is the key of
+                the stone after transform (see symmetry.py), used to hash the 8 symmetries of a board
+    """
+
+    def __init__(self, boardSize, numPlayers):
+        rand = random.Random(ZOBRIST_SEED + 1000 * boardSize + numPlayers)
+        self.pieces = [[rand.getrandbits(64) for _ in range(boardSize * boardSize)] for _ in range(numPlayers)]
+        self.turns = [rand.getrandbits(64) for _ in range(numPlayers)]
+        cells = transformCells(boardSize)
+        self.symmetricPieces = [[tuple(keys[cells[transform][cell]] for transform in range(NUM_SYMMETRIES))
+                                 for cell in range(boardSize * boardSize)] for keys in self.pieces]
+
+_keys = {}
+
+def getZobristKeys(boardSize, numPlayers):
+    """
+    Returns the ZobristKeys for a board, building them the first time they are needed.
+    """
+    if not (boardSize, numPlayers) in _keys:
+        _keys[(boardSize, numPlayers)] = ZobristKeys(boardSize, numPlayers)
+    return _keys[(boardSize, numPlayers)]